@@ -0,0 +1,119 @@
+from fnmatch import fnmatch
+from json import dump as json_dump, load as json_load
+from os import cpu_count
+from platform import machine, platform, python_version
+from statistics import mean, median, stdev
+from subprocess import run, PIPE
+from time import perf_counter, time
+from typing import Callable, Dict, List
+
+_benchmarks = {}
+
+
+def benchmark(name: str = None, number: int = 1, repeat: int = 5):
+    # the decorated function is the per-repeat setup, it returns the callable
+    # that is timed number times in a row
+    def decorator(function: Callable) -> Callable:
+        _benchmarks[name if name else function.__name__] = (
+            function, number, repeat)
+        return function
+    return decorator
+
+
+def benchmark_names() -> List[str]:
+    return list(_benchmarks)
+
+
+def _git_commit() -> str:
+    result = run(['git', 'rev-parse', 'HEAD'], stdout=PIPE, stderr=PIPE)
+    return result.stdout.decode().strip() if 0 == result.returncode else None
+
+
+def environment() -> dict:
+    import cffi
+    from crelm.cache import compiler_version, crelm_version
+
+    return {
+        'crelm': crelm_version(),
+        'commit': _git_commit(),
+        'python': python_version(),
+        'cffi': cffi.__version__,
+        'compiler': compiler_version().split('\n')[0],
+        'platform': platform(),
+        'machine': machine(),
+        'cpus': cpu_count(),
+    }
+
+
+def run_benchmark(name: str, scale: float = 1) -> dict:
+    function, number, repeat = _benchmarks[name]
+    number = max(1, int(number * scale))
+
+    times = []
+    for _ in range(repeat):
+        timed = function()
+
+        start = perf_counter()
+        for _ in range(number):
+            timed()
+        times.append((perf_counter() - start) / number)
+
+    return {
+        'number': number,
+        'repeat': repeat,
+        'times': times,
+        'min': min(times),
+        'median': median(times),
+        'mean': mean(times),
+        'stdev': stdev(times) if len(times) > 1 else 0,
+    }
+
+
+def run_benchmarks(patterns: List[str] = None, scale: float = 1, verbose: bool = True) -> dict:
+    results = {}
+
+    for name in _benchmarks:
+        if patterns and not any(fnmatch(name, x) for x in patterns):
+            continue
+
+        results[name] = run_benchmark(name, scale)
+
+        if verbose:
+            print(f'{name:32} {format_seconds(results[name]["median"]):>10} '
+                  f'(min {format_seconds(results[name]["min"])}, '
+                  f'{results[name]["repeat"]}x{results[name]["number"]})')
+
+    return {'created': time(), 'environment': environment(), 'results': results}
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit}'
+    return f'{seconds / 1e-9:.0f}ns'
+
+
+def save(results: dict, filename: str):
+    with open(filename, 'wt') as f:
+        json_dump(results, f, indent=1)
+
+
+def load(filename: str) -> dict:
+    with open(filename, 'rt') as f:
+        return json_load(f)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> Dict[str, float]:
+    # ratio of medians, > 1 means current is slower
+    ratios = {}
+
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base and base['median'] > 0:
+            ratios[name] = result['median'] / base['median']
+
+    for name, ratio in ratios.items():
+        flag = '  REGRESSION' if ratio > threshold else ''
+        print(f'{name:32} {ratio:6.2f}x{flag}')
+
+    return ratios
@@ -0,0 +1,65 @@
+from os import sysconf
+from os.path import dirname, realpath
+from subprocess import run, PIPE
+from sys import argv, executable, exit, path
+from time import perf_counter
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from crelm import Factory  # noqa: E402
+
+NUMBER_OF_FUNCTIONS = 5000
+
+
+def resident_kb() -> int:
+    with open('/proc/self/statm', 'rt') as f:
+        return int(f.read().split()[1]) * sysconf('SC_PAGE_SIZE') // 1024
+
+
+def make_tube():
+    source = '\n'.join(f'int paste_binding_{i}(int x) {{ return x + {i}; }}'
+                       for i in range(NUMBER_OF_FUNCTIONS))
+
+    return Factory().create_Tube('paste_binding').add_source_text(source)
+
+
+def measure(mode: str) -> int:
+    tube = make_tube()
+    tube.build()
+
+    rss_before = resident_kb()
+    start = perf_counter()
+
+    paste = tube._load()
+
+    if 'eager' == mode:
+        for attr in dir(tube._lib):
+            setattr(paste, attr, getattr(tube._lib, attr))
+
+    paste.paste_binding_0(1)
+
+    elapsed = perf_counter() - start
+    rss_after = resident_kb()
+
+    print(f'{elapsed} {rss_after - rss_before}')
+
+    return 0
+
+
+def main() -> int:
+    make_tube().build()
+
+    print(f'{NUMBER_OF_FUNCTIONS} functions')
+
+    for mode in ('eager', 'lazy'):
+        result = run([executable, __file__, mode], stdout=PIPE, check=True)
+        elapsed, rss = result.stdout.decode().split()[-2:]
+        print(f'{mode}: time to first call {float(elapsed) * 1000:.1f}ms, '
+              f'resident memory +{int(rss)}kB')
+
+    return 0
+
+
+if '__main__' == __name__:
+
+    exit(measure(argv[1]) if len(argv) > 1 else main())
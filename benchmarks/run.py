@@ -0,0 +1,243 @@
+from argparse import ArgumentParser
+from array import array
+from functools import lru_cache
+from itertools import count
+from os.path import dirname, join as path_join, realpath
+from sys import exit, path
+from tempfile import TemporaryDirectory
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from crelm import ArtifactStore, Factory  # noqa: E402
+from crelm.cdefs import CdefCache  # noqa: E402
+from crelm.headers import HeaderCache  # noqa: E402
+from crelm.objects import ObjectCache  # noqa: E402
+
+from harness import benchmark, benchmark_names, compare, load, run_benchmarks, save  # noqa: E402
+
+EXAMPLES_FOLDER = path_join(dirname(dirname(realpath(__file__))), 'examples')
+
+_scratch = TemporaryDirectory(prefix='crelm_benchmarks_')
+_names = count()
+
+ADD_SOURCE = 'int bench_add(int a, int b) { return a + b; }'
+SCALE_SOURCE = 'double bench_scale(double x, int k) { return x * k; }'
+STRING_SOURCE = 'int bench_length(char const *s) { int n = 0; while (*s++) ++n; return n; }'
+
+
+def unique_name(prefix: str) -> str:
+    return f'{prefix}_{next(_names)}'
+
+
+def make_source(functions: int) -> str:
+    return '\n'.join(f'int bench_fn_{i}(int x) {{ return x + {i}; }}'
+                     for i in range(functions))
+
+
+def isolated_tube(name: str, source: str):
+    # every cache in its own empty folder, so nothing is reused
+    root = path_join(_scratch.name, name)
+
+    return Factory().create_Tube(name) \
+        .set_artifact_store(ArtifactStore(path_join(root, 'artifacts'))) \
+        .set_object_cache(ObjectCache(path_join(root, 'objects'))) \
+        .set_header_cache(HeaderCache(path_join(root, 'headers'))) \
+        .set_cdef_cache(CdefCache(path_join(root, 'cdefs'))) \
+        .add_source_text(source)
+
+
+@lru_cache(maxsize=None)
+def add_tube():
+    tube = isolated_tube('bench_add', ADD_SOURCE)
+    tube.squeeze()
+    return tube
+
+
+@lru_cache(maxsize=None)
+def scale_paste():
+    return isolated_tube('bench_scale', SCALE_SOURCE) \
+        .add_vectorized('bench_scale') \
+        .squeeze()
+
+
+@lru_cache(maxsize=None)
+def string_paste():
+    return isolated_tube('bench_string', STRING_SOURCE).squeeze()
+
+
+@lru_cache(maxsize=None)
+def many_functions_tube():
+    tube = isolated_tube('bench_many', make_source(2000))
+    tube.squeeze()
+    return tube
+
+
+@lru_cache(maxsize=None)
+def libcrelm():
+    return Factory().create_LibCrelm()
+
+
+@lru_cache(maxsize=None)
+def pi_paste(algorithm: str):
+    return Factory().create_Tube(f'bench_pi_{algorithm.lower()}') \
+        .set_source_folder(EXAMPLES_FOLDER) \
+        .add_header_file('pi.h') \
+        .add_source_file('pi.c') \
+        .add_macros([f'USE_{algorithm}', 'USE_DOUBLE']) \
+        .squeeze()
+
+
+@benchmark('squeeze.cold', repeat=3)
+def squeeze_cold():
+    tube = isolated_tube(unique_name('bench_cold'), ADD_SOURCE)
+    return tube.squeeze
+
+
+@benchmark('squeeze.warm', number=5)
+def squeeze_warm():
+    return add_tube().squeeze
+
+
+@benchmark('libcrelm.make.small', number=200)
+def libcrelm_make_small():
+    lib = libcrelm()
+    return lambda: lib.make(ADD_SOURCE)
+
+
+@benchmark('libcrelm.make.large', number=5)
+def libcrelm_make_large():
+    lib = libcrelm()
+    source = make_source(2000)
+    return lambda: lib.make(source)
+
+
+@benchmark('paste.first_access', number=1, repeat=20)
+def paste_first_access():
+    tube = many_functions_tube()
+    return lambda: tube.Paste(tube).bench_fn_0
+
+
+@benchmark('paste.attribute', number=100000)
+def paste_attribute():
+    paste = add_tube().Paste(add_tube())
+    paste.bench_add
+    return lambda: paste.bench_add
+
+
+@benchmark('call.scalar', number=100000)
+def call_scalar():
+    add = add_tube().Paste(add_tube()).bench_add
+    return lambda: add(2, 3)
+
+
+@benchmark('call.loop_1000', number=100)
+def call_loop():
+    scale = scale_paste().bench_scale
+    values = array('d', range(1000))
+    return lambda: [scale(x, 3) for x in values]
+
+
+@benchmark('call.vec_1000', number=1000)
+def call_vec():
+    scale = scale_paste().bench_scale
+    values = array('d', range(1000))
+    out = array('d', values)
+    return lambda: scale.vec(values, 3, out=out)
+
+
+@benchmark('alloc.new_1000', number=100)
+def alloc_new():
+    paste = string_paste()
+    return lambda: [paste.new('int') for _ in range(1000)]
+
+
+@benchmark('alloc.arena_1000', number=100)
+def alloc_arena():
+    arena = string_paste().arena()
+
+    def allocate():
+        with arena:
+            return [arena.new('int') for _ in range(1000)]
+
+    return allocate
+
+
+@benchmark('marshal.new_char_array', number=20000)
+def marshal_new_char_array():
+    paste = string_paste()
+    text = 'crelm' * 20
+    return lambda: paste.new_char_array(text)
+
+
+@benchmark('marshal.str', number=20000)
+def marshal_str():
+    paste = string_paste()
+    buffer = paste.new_char_array('crelm' * 20)
+    return lambda: paste.str(buffer)
+
+
+@benchmark('marshal.call_with_string', number=20000)
+def marshal_call_with_string():
+    paste = string_paste()
+    text = 'crelm' * 20
+    return lambda: paste.bench_length(paste.new_char_array(text))
+
+
+def pi_kernel(algorithm: str):
+    paste = pi_paste(algorithm)
+    state = paste.new('struct infinite_series_state_t')
+
+    # infinite_series_run continues from the iterations already completed, so every timed
+    # call starts the series again
+    def compute():
+        paste.infinite_series_init(state)
+        return paste.infinite_series_run(state, 1000000)
+
+    return compute
+
+
+for _algorithm in ('LEIBNIZ', 'NILAKANTHA', 'EULER'):
+    benchmark(f'pi.{_algorithm.lower()}')(
+        lambda algorithm=_algorithm: pi_kernel(algorithm))
+
+
+def make_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog='benchmarks/run.py',
+                            description='crelm build and call benchmarks')
+    parser.add_argument('patterns', nargs='*',
+                        help='only run benchmarks matching these globs')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--scale', type=float, default=1,
+                        help='multiply the iterations of every benchmark')
+    parser.add_argument('--list', action='store_true',
+                        help='list benchmark names and exit')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='slowdown ratio reported as a regression')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+
+    if args.list:
+        print('\n'.join(benchmark_names()))
+        return 0
+
+    if args.compare:
+        ratios = compare(load(args.compare[0]),
+                         load(args.compare[1]), args.threshold)
+        return 1 if any(x > args.threshold for x in ratios.values()) else 0
+
+    results = run_benchmarks(args.patterns, args.scale)
+
+    if args.output:
+        save(results, args.output)
+
+    return 0
+
+
+if '__main__' == __name__:
+
+    exit(main())
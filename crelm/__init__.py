@@ -1,6 +1,9 @@
 from .tube import Tube
 from .libcrelm import LibCrelm
 from .factory import Factory
+from .store import ArtifactStore
+from .errors import BuildError
+from .report import BuildReport, BuildHook, LoggingHook, add_build_hook, remove_build_hook
 
 # todo foss: improve this
 from .factory import VerboseFactory, DebugFactory, VerboseDebugFactory
@@ -0,0 +1,154 @@
+from argparse import ArgumentParser
+from sys import exit
+from typing import Dict, List
+
+from .cdefs import CdefCache
+from .errors import BuildError
+from .factory import Factory
+from .headers import HeaderCache
+from .manifest import tubes_from_manifest
+from .objects import ObjectCache
+from .store import ArtifactStore
+
+# foss: every store crelm writes to, each has its own size and age cap
+STORES = ('artifacts', 'objects', 'headers', 'cdefs')
+
+
+def store_root(name: str) -> str:
+    if 'artifacts' == name:
+        return ArtifactStore().root
+
+    cache = {'objects': ObjectCache, 'headers': HeaderCache, 'cdefs': CdefCache}[name]()
+    return cache.store.root
+
+
+def make_stores(args) -> Dict[str, ArtifactStore]:
+    if args.root:
+        roots = {'artifacts': args.root}
+    else:
+        roots = {name: store_root(name) for name in args.store or STORES}
+
+    return {name: ArtifactStore(root=root,
+                                max_bytes=args.max_bytes,
+                                max_age=args.max_age)
+            for name, root in roots.items()}
+
+
+def cache_stats(args) -> int:
+    for name, store in make_stores(args).items():
+        stats = store.stats()
+
+        print(f'[{name}]')
+        print(f'root: {stats["root"]}')
+        print(f'entries: {stats["entries"]}')
+        print(f'bytes: {stats["bytes"]} (max {stats["max_bytes"]})')
+        print(f'max age: {stats["max_age"]}s')
+        print(f'names: {", ".join(stats["names"])}')
+
+    return 0
+
+
+def cache_prune(args) -> int:
+    for name, store in make_stores(args).items():
+        removed = store.clear() if args.all else store.prune()
+
+        print(f'{name}: removed {len(removed)} entries')
+
+    return 0
+
+
+def timing_table(tubes: List, results: List) -> List[str]:
+    phases = []
+    for result in results:
+        if not isinstance(result, BuildError):
+            phases += [x for x in result.phases if x not in phases]
+
+    rows = [['tube', 'status'] + phases + ['total', 'cpu']]
+
+    for tube, result in zip(tubes, results):
+        if isinstance(result, BuildError):
+            rows.append([tube._name, 'failed'] + [''] * len(phases) + ['', ''])
+            continue
+
+        timings = result.timings
+
+        rows.append([tube._name, 'cached' if result.cache_hit else 'built'] +
+                    [f'{timings[x]:.3f}' if x in timings else '' for x in phases] +
+                    [f'{result.wall:.3f}', f'{result.cpu:.3f}'])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    return ['  '.join(cell.ljust(width) if i < 2 else cell.rjust(width)
+                      for i, (cell, width) in enumerate(zip(row, widths))).rstrip()
+            for row in rows]
+
+
+def build(args) -> int:
+    factory = Factory(verbose=args.verbose)
+
+    try:
+        tubes = tubes_from_manifest(factory, args.manifest)
+    except (OSError, ValueError, BuildError) as arg:
+        print(f'crelm: {arg}')
+        return 2
+
+    store = ArtifactStore(root=args.artifacts) if args.artifacts else None
+
+    for tube in tubes:
+        tube.set_artifact_store(store).verbose(args.verbose)
+
+    results = factory.build_all(tubes, workers=args.workers)
+
+    for line in timing_table(tubes, results):
+        print(line)
+
+    errors = [x for x in results if isinstance(x, BuildError)]
+    for error in errors:
+        print(f'error: {error}')
+
+    return 1 if errors else 0
+
+
+def make_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog='crelm')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cache = commands.add_parser('cache', help='manage the artifact store')
+    cache.add_argument('--root', help='manage only the store in this folder')
+    cache.add_argument('--store', action='append', choices=STORES,
+                       help='manage only this store, may be repeated')
+    cache.add_argument('--max-bytes', type=int, help='size cap in bytes')
+    cache.add_argument('--max-age', type=float, help='age cap in seconds')
+
+    cache_commands = cache.add_subparsers(dest='cache_command', required=True)
+
+    stats = cache_commands.add_parser('stats', help='show store usage')
+    stats.set_defaults(func=cache_stats)
+
+    prune = cache_commands.add_parser(
+        'prune', help='evict artifacts over the size or age cap')
+    prune.add_argument('--all', action='store_true',
+                       help='remove every artifact')
+    prune.set_defaults(func=cache_prune)
+
+    build_command = commands.add_parser(
+        'build', help='build every tube in a manifest')
+    build_command.add_argument('manifest', help='JSON or TOML manifest file')
+    build_command.add_argument('--artifacts', help='artifact store folder')
+    build_command.add_argument('--workers', type=int,
+                               help='number of parallel builds')
+    build_command.add_argument('--verbose', action='store_true')
+    build_command.set_defaults(func=build)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+
+    return args.func(args)
+
+
+if '__main__' == __name__:
+
+    exit(main())
@@ -0,0 +1,102 @@
+from functools import lru_cache
+from hashlib import sha256
+from importlib.metadata import version, PackageNotFoundError
+from os.path import join as path_join
+from subprocess import run, PIPE, DEVNULL
+from tempfile import TemporaryDirectory
+from typing import List
+
+_OPENMP_TEST_SOURCE = '''#include <omp.h>
+int main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }
+'''
+
+
+@lru_cache(maxsize=None)
+def compiler_version() -> str:
+    try:
+        result = run(['gcc', '--version'], stdout=PIPE, stderr=DEVNULL)
+    except OSError:
+        return ''
+
+    return result.stdout.decode().strip() if 0 == result.returncode else ''
+
+
+@lru_cache(maxsize=None)
+def native_arch() -> str:
+    try:
+        result = run(['gcc', '-march=native', '-Q', '--help=target'],
+                     stdout=PIPE, stderr=DEVNULL)
+    except OSError:
+        return ''
+
+    for line in result.stdout.decode().split('\n'):
+        option, _, value = line.strip().partition('\t')
+        if '-march=' == option.strip():
+            return value.strip()
+
+    return ''
+
+
+@lru_cache(maxsize=None)
+def openmp_supported() -> bool:
+    with TemporaryDirectory() as folder:
+        source = path_join(folder, 'openmp.c')
+
+        with open(source, 'wt') as f:
+            f.write(_OPENMP_TEST_SOURCE)
+
+        try:
+            result = run(['gcc', '-fopenmp', source, '-o', path_join(folder, 'openmp')],
+                         stdout=DEVNULL, stderr=DEVNULL)
+        except OSError:
+            return False
+
+        return 0 == result.returncode
+
+
+@lru_cache(maxsize=None)
+def crelm_version() -> str:
+    try:
+        return version('crelm')
+    except PackageNotFoundError:
+        return 'dev'
+
+
+class BuildKey:
+    def __init__(self):
+        self._hash = sha256()
+
+    def _add(self, label: str, data: bytes):
+        self._hash.update(f'{label}:{len(data)}:'.encode('utf-8'))
+        self._hash.update(data)
+
+    def add_text(self, label: str, text: str):
+        self._add(label, text.encode('utf-8'))
+        return self
+
+    def add_texts(self, label: str, texts: List[str]):
+        self.add_text(label, str(len(texts)))
+        for text in texts:
+            self.add_text(label, text)
+        return self
+
+    def add_file(self, label: str, filename: str):
+        self.add_text(label, filename)
+
+        try:
+            with open(filename, 'rb') as f:
+                self._add(label, f.read())
+        except OSError:
+            self.add_text(label, '<missing>')
+
+        return self
+
+    def add_files(self, label: str, filenames: List[str]):
+        self.add_text(label, str(len(filenames)))
+        for filename in filenames:
+            self.add_file(label, filename)
+        return self
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
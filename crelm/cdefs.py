@@ -0,0 +1,95 @@
+from os.path import join as path_join
+from pickle import dumps, loads
+from sys import version as python_version
+from tempfile import gettempdir
+from threading import Lock
+
+import cffi
+import pycparser
+
+from .cache import BuildKey
+from .store import ArtifactStore
+
+_stats_lock = Lock()
+
+
+class CdefCache:
+    # everything FFI.cdef() leaves on the parser that set_source() needs
+    _PARSER_STATE = ('_declarations', '_included_declarations', '_anonymous_counter',
+                     '_options', '_int_constants', '_uses_new_feature')
+    _ENTRY_FILENAME = 'parser.pickle'
+
+    def __init__(self, root: str = None, verbose: bool = False):
+        self._store = ArtifactStore(root if root else path_join(
+            gettempdir(), 'crelm', 'cdefs'))
+        self._verbose = verbose
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self) -> ArtifactStore:
+        return self._store
+
+    def _count(self, hit: bool):
+        with _stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _make_key(cdef: str) -> str:
+        return BuildKey() \
+            .add_text('cdef', cdef) \
+            .add_text('cffi', cffi.__version__) \
+            .add_text('pycparser', pycparser.__version__) \
+            .add_text('python', python_version) \
+            .digest
+
+    def _entry_filename(self, key: str) -> str:
+        return path_join(self._store.path(key), CdefCache._ENTRY_FILENAME)
+
+    def _load(self, ffi, key: str) -> bool:
+        if not self._store.lookup(key):
+            return False
+
+        try:
+            with open(self._entry_filename(key), 'rb') as f:
+                state = loads(f.read())
+        except Exception:
+            return False
+
+        for name, value in zip(CdefCache._PARSER_STATE, state):
+            setattr(ffi._parser, name, value)
+
+        return True
+
+    def _save(self, ffi, key: str):
+        scratch = self._store.scratch(key)
+
+        state = tuple(getattr(ffi._parser, name)
+                      for name in CdefCache._PARSER_STATE)
+
+        with open(path_join(scratch, CdefCache._ENTRY_FILENAME), 'wb') as f:
+            f.write(dumps(state))
+
+        self._store.publish(key, 'cdef', scratch)
+
+    def apply(self, ffi, cdef: str) -> bool:
+        key = CdefCache._make_key(cdef)
+
+        hit = self._load(ffi, key)
+        self._count(hit)
+
+        if self._verbose:
+            print(f'cdef cache {"hit" if hit else "miss"} ({key})')
+
+        if hit:
+            ffi._cdefsources.append(cdef)
+            return True
+
+        ffi.cdef(cdef)
+        self._save(ffi, key)
+
+        return False
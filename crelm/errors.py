@@ -0,0 +1,8 @@
+class BuildError(Exception):
+    def __init__(self, name: str, message: str):
+        super().__init__(name, message)
+        self.name = name
+        self.message = message
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.message}'
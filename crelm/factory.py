@@ -1,11 +1,23 @@
 
+from asyncio import Semaphore, ensure_future, gather
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
 from tempfile import gettempdir
+from threading import Lock
+from typing import List
+
+from .errors import BuildError
+
+
+def _build_tube(tube):
+    return tube.build().report
 
 
 class FactoryState:
     _lib_debug = None
     _lib_release = None
     _gen_folder = None
+    _lock = Lock()
 
     def __init__(self, factory, verbose: bool = False, debug: bool = False, path=None):
         self.factory = factory
@@ -25,6 +37,10 @@ class FactoryState:
         return FactoryState._lib_debug if self._debug else FactoryState._lib_release
 
     def build_lib(self):
+        with FactoryState._lock:
+            return self._build_lib()
+
+    def _build_lib(self):
         if self._debug and not FactoryState._lib_debug:
             FactoryState._lib_debug = self.factory._build_lib(
                 verbose=self._verbose,
@@ -56,7 +72,8 @@ class Factory:
             .verbose(verbose) \
             .set_gen_folder(path) \
             .set_source_folder_relative(__file__) \
-            .add_header_text('int make_header(char const *source, char *header);') \
+            .add_header_text('long make_header(char const *source, char *header, size_t capacity);') \
+            .add_header_text('size_t make_headers(char const *sources, int count, char *headers, size_t capacity);') \
             .add_source_file('makeheaders_crelm.c') \
             .add_macro_if(debug, 'DEBUG') \
             .save_compiler_temps() \
@@ -76,6 +93,61 @@ class Factory:
 
         return Tube(name=name)
 
+    def build_all(self, tubes: List, workers: int = None) -> List:
+        keys = [tube._make_build_key() for tube in tubes]
+        builds = {}
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for key, tube in zip(keys, tubes):
+                if key not in builds:
+                    builds[key] = executor.submit(_build_tube, tube)
+
+            results = []
+
+            for key, tube in zip(keys, tubes):
+                try:
+                    results.append(builds[key].result())
+                except BuildError as arg:
+                    results.append(arg)
+                except Exception as arg:
+                    results.append(BuildError(tube._name, f'build failed ({arg})'))
+
+        return results
+
+    def squeeze_all(self, tubes: List, workers: int = None) -> List:
+        results = []
+
+        for tube, built in zip(tubes, self.build_all(tubes, workers)):
+            try:
+                results.append(built if isinstance(
+                    built, BuildError) else tube.build()._load())
+            except BuildError as arg:
+                results.append(arg)
+            except Exception as arg:
+                results.append(BuildError(tube._name, f'build failed ({arg})'))
+
+        return results
+
+    async def squeeze_all_async(self, tubes: List, workers: int = None) -> List:
+        semaphore = Semaphore(workers or cpu_count())
+        builds = {}
+
+        async def squeeze(tube):
+            key = tube._make_build_key()
+
+            if key not in builds:
+                builds[key] = ensure_future(tube._build_async(semaphore))
+
+            try:
+                await builds[key]
+                return tube.build()._load()
+            except BuildError as arg:
+                return arg
+            except Exception as arg:
+                return BuildError(tube._name, f'build failed ({arg})')
+
+        return list(await gather(*[squeeze(tube) for tube in tubes]))
+
 
 class VerboseFactory(Factory):
 
@@ -0,0 +1,135 @@
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+from importlib.machinery import EXTENSION_SUFFIXES
+from json import dump as json_dump, load as json_load
+from os import makedirs, walk
+from os.path import basename, dirname, exists, join as path_join, relpath
+from shutil import copyfile, rmtree
+from sys import implementation, version_info
+from sysconfig import get_platform
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from .cache import crelm_version
+from .errors import BuildError
+
+METADATA_FILENAME = 'crelm_frozen.json'
+
+_INIT_TEMPLATE = '''# generated by crelm {crelm_version} from tube "{name}", do not edit
+from ._paste import Paste
+from .{module} import ffi, lib
+
+paste = Paste(lib, ffi)
+
+
+def load() -> Paste:
+    return paste
+
+
+def __getattr__(name: str):
+    return getattr(paste, name)
+'''
+
+
+def module_filename(folder: str, module: str) -> str:
+    filenames = [path_join(folder, module + suffix)
+                 for suffix in EXTENSION_SUFFIXES]
+
+    return next((x for x in filenames if exists(x)), None)
+
+
+def write_package(folder: str, package: str, name: str, extension_filename: str,
+                  cdef: str, key: str) -> str:
+    package_folder = path_join(folder, package)
+
+    # only a package written by an earlier freeze is replaced
+    if exists(package_folder):
+        if not exists(path_join(package_folder, METADATA_FILENAME)):
+            raise BuildError(name, f'{package_folder} exists and is not a frozen package')
+
+        rmtree(package_folder)
+
+    makedirs(package_folder)
+
+    module = basename(extension_filename).split('.')[0]
+
+    copyfile(extension_filename, path_join(
+        package_folder, basename(extension_filename)))
+    copyfile(path_join(dirname(__file__), 'paste.py'),
+             path_join(package_folder, '_paste.py'))
+
+    with open(path_join(package_folder, 'cdef.h'), 'wt') as f:
+        f.write(cdef)
+
+    with open(path_join(package_folder, METADATA_FILENAME), 'wt') as f:
+        json_dump({'name': name,
+                   'module': module,
+                   'key': key,
+                   'crelm': crelm_version()}, f, indent=1)
+
+    with open(path_join(package_folder, '__init__.py'), 'wt') as f:
+        f.write(_INIT_TEMPLATE.format(crelm_version=crelm_version(),
+                                      name=name, module=module))
+
+    return package_folder
+
+
+def _wheel_tag() -> str:
+    python_tag = f'{implementation.name[:2]}{version_info.major}{version_info.minor}'
+    platform_tag = get_platform().replace('-', '_').replace('.', '_')
+
+    return f'{python_tag}-{python_tag}-{platform_tag}'
+
+
+def _record_line(arcname: str, data: bytes) -> str:
+    digest = urlsafe_b64encode(sha256(data).digest()).rstrip(b'=').decode()
+    return f'{arcname},sha256={digest},{len(data)}'
+
+
+def write_wheel(package_folder: str, dist_folder: str, version: str = '0.0.0') -> str:
+    package = basename(package_folder)
+
+    with open(path_join(package_folder, METADATA_FILENAME), 'rt') as f:
+        name = json_load(f)['name']
+
+    tag = _wheel_tag()
+    dist_info = f'{package}-{version}.dist-info'
+
+    files = {}
+    for dirpath, _, filenames in walk(package_folder):
+        for filename in filenames:
+            if filename.endswith('.pyc'):
+                continue
+
+            fullpath = path_join(dirpath, filename)
+            arcname = relpath(fullpath, dirname(package_folder))
+            with open(fullpath, 'rb') as f:
+                files[arcname.replace('\\', '/')] = f.read()
+
+    files[f'{dist_info}/METADATA'] = '\n'.join([
+        'Metadata-Version: 2.1',
+        f'Name: {package}',
+        f'Version: {version}',
+        f'Summary: Frozen crelm tube "{name}"',
+        'Requires-Dist: cffi',
+        '']).encode()
+
+    files[f'{dist_info}/WHEEL'] = '\n'.join([
+        'Wheel-Version: 1.0',
+        f'Generator: crelm {crelm_version()}',
+        'Root-Is-Purelib: false',
+        f'Tag: {tag}',
+        '']).encode()
+
+    record = [_record_line(arcname, data)
+              for arcname, data in files.items()]
+    record.append(f'{dist_info}/RECORD,,')
+
+    makedirs(dist_folder, exist_ok=True)
+    wheel_filename = path_join(dist_folder, f'{package}-{version}-{tag}.whl')
+
+    with ZipFile(wheel_filename, 'w', ZIP_DEFLATED) as wheel:
+        for arcname, data in files.items():
+            wheel.writestr(arcname, data)
+        wheel.writestr(f'{dist_info}/RECORD', '\n'.join(record) + '\n')
+
+    return wheel_filename
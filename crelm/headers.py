@@ -0,0 +1,113 @@
+from json import load as json_load, dump as json_dump
+from os.path import join as path_join
+from tempfile import gettempdir
+from threading import Lock
+from typing import Dict, Tuple
+
+from .objects import file_digest
+from .store import ArtifactStore
+
+_stats_lock = Lock()
+
+
+def declaration_skeleton(text: str) -> str:
+    # drops function bodies from preprocessed C, so that the result only
+    # changes when something makeheaders could emit changes
+    out = []
+    last = ''
+    depth = 0
+    body_depth = None
+    i = 0
+
+    while i < len(text):
+        c = text[i]
+
+        if c in '"\'':
+            end = i + 1
+            while end < len(text) and text[end] != c:
+                end += 2 if '\\' == text[end] else 1
+            if body_depth is None:
+                out.append(text[i:end + 1])
+                last = c
+            i = end + 1
+            continue
+
+        if '{' == c:
+            if body_depth is None and ')' == last:
+                body_depth = depth
+                out.append('{}')
+            depth += 1
+        elif '}' == c:
+            depth -= 1
+            if body_depth is not None and depth == body_depth:
+                body_depth = None
+                last = '}'
+                i += 1
+                continue
+
+        if body_depth is None:
+            out.append(c)
+            if not c.isspace():
+                last = c
+
+        i += 1
+
+    return ''.join(out)
+
+
+class HeaderCache:
+    _ENTRY_FILENAME = 'headers.json'
+
+    def __init__(self, root: str = None, verbose: bool = False):
+        self._store = ArtifactStore(root if root else path_join(
+            gettempdir(), 'crelm', 'headers'))
+        self._verbose = verbose
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self) -> ArtifactStore:
+        return self._store
+
+    def _entry_filename(self, key: str) -> str:
+        return path_join(self._store.path(key), HeaderCache._ENTRY_FILENAME)
+
+    def _count(self, hit: bool):
+        with _stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _load_entry(self, key: str) -> dict:
+        try:
+            with open(self._entry_filename(key), 'rt') as f:
+                return json_load(f)
+        except (OSError, ValueError):
+            return None
+
+    def dependencies(self, key: str) -> Dict[str, str]:
+        entry = self._load_entry(key)
+        return entry['deps'] if entry else {}
+
+    def lookup(self, key: str) -> Tuple[str, str]:
+        entry = self._load_entry(key) if self._store.lookup(key) else None
+
+        if entry and any(digest != file_digest(dep) for dep, digest in entry['deps'].items()):
+            entry = None
+
+        self._count(entry is not None)
+
+        if self._verbose:
+            print(f'header cache {"hit" if entry else "miss"} ({key})')
+
+        return (entry['header'], entry['cdef']) if entry else None
+
+    def save(self, key: str, header: str, cdef: str, deps: Dict[str, str]):
+        scratch = self._store.scratch(key)
+
+        with open(path_join(scratch, HeaderCache._ENTRY_FILENAME), 'wt') as f:
+            json_dump({'header': header, 'cdef': cdef, 'deps': deps}, f)
+
+        self._store.publish(key, 'headers', scratch)
@@ -1,11 +1,67 @@
+from threading import Lock
+from typing import List
+from weakref import WeakKeyDictionary
+
+
 class LibCrelm:
+    # makeheaders keeps its state in globals, so calls into it are serialised
+    _lock = Lock()
+
+    # char buffers are reused across calls, one pair per loaded libcrelm
+    _buffers = WeakKeyDictionary()
+    _MIN_BUFFER_SIZE = 4096
+
     def __init__(self, lib):
         self._lib = lib
 
+    def _buffer(self, index: int, size: int):
+        buffers = LibCrelm._buffers.setdefault(self._lib, [None, None])
+        buffer = buffers[index]
+
+        if buffer is None or len(buffer) < size:
+            buffer = self._lib.new_char_array(max(
+                size, 2 * len(buffer) if buffer else LibCrelm._MIN_BUFFER_SIZE))
+            buffers[index] = buffer
+
+        return buffer
+
     def make(self, source: str) -> str:
-        self._source_buffer = self._lib.new_char_array(source)
-        self._header_buffer = self._lib.new_char_array(len(source) + 1)
+        data = source.encode('utf-8') + b'\0'
+
+        with LibCrelm._lock:
+            source_buffer = self._buffer(0, len(data))
+
+            self._lib.buffer(source_buffer, len(data))[:] = data
+
+            # declarations can be longer than the source (int a; becomes
+            # extern int a;), so the header is retried when it did not fit
+            header_buffer = self._buffer(1, 2 * len(data))
+            length = self._lib.make_header(source_buffer, header_buffer, len(header_buffer))
+
+            if length >= len(header_buffer):
+                header_buffer = self._buffer(1, length + 1)
+                self._lib.make_header(source_buffer, header_buffer, len(header_buffer))
+
+            return self._lib.str(header_buffer).strip()
+
+    def make_many(self, sources: List[str]) -> List[str]:
+        if not sources:
+            return []
+
+        packed = '\0'.join(sources)
+
+        source_buffer = self._lib.new_char_array(packed)
+        header_buffer = self._lib.new_char_array(2 * len(source_buffer))
+
+        with LibCrelm._lock:
+            needed = self._lib.make_headers(
+                source_buffer, len(sources), header_buffer, len(header_buffer))
+
+            if needed > len(header_buffer):
+                header_buffer = self._lib.new_char_array(needed)
+                self._lib.make_headers(
+                    source_buffer, len(sources), header_buffer, len(header_buffer))
 
-        self._lib.make_header(self._source_buffer, self._header_buffer)
+        headers = self._lib.buffer(header_buffer)[:].split(b'\0')[:len(sources)]
 
-        return self._lib.str(self._header_buffer).strip()
+        return [header.decode('utf-8').strip() for header in headers]
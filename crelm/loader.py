@@ -0,0 +1,48 @@
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import realpath
+from sys import modules as sys_modules
+from threading import Lock
+from typing import Tuple
+
+# foss: a dlopen of a path that is already loaded hands back the same
+# library, so each extension file is loaded once per process
+_modules = {}
+_lock = Lock()
+
+
+def module_name(key: str, module: str) -> str:
+    # the extension's init function is named after the last component, so
+    # the key goes in front to keep artifacts of the same tube apart
+    return f'_crelm_{key}.{module}'
+
+
+def load_extension(filename: str, name: str) -> Tuple[object, bool]:
+    filename = realpath(filename)
+
+    with _lock:
+        module = _modules.get(filename)
+        if module:
+            return module, True
+
+        spec = spec_from_file_location(name, filename)
+        if not spec:
+            raise ImportError(f'{filename} is not an extension module')
+
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        # cffi registers the module and its lib under their own names too,
+        # the registry holds the only reference so rebuilt tubes do not pile
+        # up in sys.modules
+        lib = getattr(module, 'lib', None)
+        for key in [key for key, value in sys_modules.items() if value is module or value is lib]:
+            del sys_modules[key]
+
+        _modules[filename] = module
+
+    return module, False
+
+
+def loaded_extensions() -> dict:
+    with _lock:
+        return {filename: module.__name__ for filename, module in _modules.items()}
@@ -12,13 +12,27 @@
 // the (seemingly compatible) 2-clause BSD license.
 
 // foss: WARNING: makeheaders keeps a lot of global state which makes
-// it awkward to use in a library. Make sure the state is reset between runs.
+// it awkward to use in a library. Make sure the state is reset between runs,
+// and note that calls must be serialised by the caller (see LibCrelm).
 
-static int build_declarations(char *header, FILE *log_file) {
+static void reset_state(void) {
+  pDeclFirst = 0;
+  pDeclLast = 0;
+  ifStack = 0;
+  includeList = 0;
+  blockComment = 0;
+  memset(apTable, 0, sizeof(apTable));
+}
+
+// foss: like snprintf, returns the full length of the declarations and
+// writes no more than capacity bytes, so the caller can retry with more room
+static long build_declarations(char *header, size_t capacity, FILE *log_file) {
   GenState sState;
   String outStr;
   IdentTable includeTable;
   Decl *pDecl;
+  char const *text;
+  size_t length;
 
   sState.pStr = &outStr;
   StringInit(&outStr);
@@ -37,7 +51,15 @@ static int build_declarations(char *header, FILE *log_file) {
   }
 
   ChangeIfContext(0, &sState);
-  strcpy(header, StringGet(&outStr));
+
+  text = StringGet(&outStr);
+  length = strlen(text);
+
+  if (capacity > 0) {
+    size_t n = length < capacity ? length : capacity - 1;
+    memcpy(header, text, n);
+    header[n] = 0;
+  }
 
 #ifdef DEBUG
   fprintf(log_file, "emitting decl: '%s'\n", header);
@@ -45,14 +67,19 @@ static int build_declarations(char *header, FILE *log_file) {
 
   IdentTableReset(&includeTable);
   StringReset(&outStr);
-  return 0;
+  return (long)length;
 }
 
-int make_header(char const *source, char *header) {
+// foss: returns the length of the header, or -1 when the source has errors
+long make_header(char const *source, char *header, size_t capacity) {
   Token *pList;
   FILE *log_file = stdout;
   IdentTable idTable;
-  int rv = 0;
+  long rv = -1;
+
+  if (capacity > 0) {
+    *header = 0;
+  }
 
 #ifdef DEBUG
   debugMask = DEBUG;
@@ -61,8 +88,7 @@ int make_header(char const *source, char *header) {
 #endif
 
   memset(&idTable, 0, sizeof(IdentTable));
-  pDeclFirst = 0;
-  pDeclLast = 0;
+  reset_state();
 
 #ifdef DEBUG
   printf("%s", source);
@@ -72,12 +98,11 @@ int make_header(char const *source, char *header) {
 
   if (!pList) {
     fprintf(log_file, "Errors while processing source\n");
-    return 1;
+    return -1;
   }
 
-  rv = ParseFile(pList, 0);
-  if (!rv) {
-    rv = build_declarations(header, log_file);
+  if (!ParseFile(pList, 0)) {
+    rv = build_declarations(header, capacity, log_file);
   }
 
   fflush(log_file);
@@ -85,3 +110,20 @@ int make_header(char const *source, char *header) {
 
   return rv;
 }
+
+// foss: sources and headers are packed as consecutive nul-terminated strings,
+// returns the bytes the headers need, which is more than capacity when the
+// output was cut short
+size_t make_headers(char const *sources, int count, char *headers, size_t capacity) {
+  size_t used = 0;
+
+  for (int i = 0; i < count; ++i) {
+    size_t room = used < capacity ? capacity - used : 0;
+    long length = make_header(sources, headers + (room ? used : 0), room);
+
+    used += (length > 0 ? (size_t)length : 0) + 1;
+    sources += strlen(sources) + 1;
+  }
+
+  return used;
+}
@@ -0,0 +1,88 @@
+from json import load as json_load
+from os.path import abspath, dirname, join as path_join
+from typing import List
+
+from .errors import BuildError
+
+try:
+    from tomllib import load as toml_load
+except ImportError:
+    try:
+        from tomli import load as toml_load
+    except ImportError:
+        toml_load = None
+
+# foss: manifest keys map onto the Tube builder methods of the same meaning
+_LIST_KEYS = ('sources', 'headers', 'sources_and_headers', 'include_dirs',
+              'macros', 'externs', 'suppress_warnings')
+
+
+def load_manifest(filename: str) -> dict:
+    if filename.endswith('.toml'):
+        if not toml_load:
+            raise BuildError(filename, 'reading TOML manifests needs python 3.11 or tomli')
+
+        with open(filename, 'rb') as f:
+            return toml_load(f)
+
+    with open(filename, 'rt') as f:
+        return json_load(f)
+
+
+def _tube_from_entry(factory, entry: dict, folder: str):
+    name = entry.get('name')
+    if not name:
+        raise BuildError(folder, 'manifest tube has no name')
+
+    unknown = set(entry) - set(_LIST_KEYS) - \
+        {'name', 'source_folder', 'source_text', 'header_text', 'optimize', 'openmp'}
+    if unknown:
+        raise BuildError(name, f'unknown manifest keys {", ".join(sorted(unknown))}')
+
+    for key in _LIST_KEYS:
+        if not isinstance(entry.get(key, []), list):
+            raise BuildError(name, f'manifest key "{key}" must be a list')
+
+    source_folder = path_join(folder, entry.get('source_folder', '.'))
+
+    tube = factory.create_Tube(name) \
+        .set_source_folder(source_folder) \
+        .add_source_files(entry.get('sources', [])) \
+        .add_header_files(entry.get('headers', [])) \
+        .add_source_and_header_files(entry.get('sources_and_headers', [])) \
+        .add_macros(entry.get('macros', [])) \
+        .add_externs(entry.get('externs', []))
+
+    if 'source_text' in entry:
+        tube.add_source_text(entry['source_text'])
+
+    if 'header_text' in entry:
+        tube.add_header_text(entry['header_text'])
+
+    for include_dir in entry.get('include_dirs', []):
+        tube.add_include_dir_relative(include_dir)
+
+    for warning in entry.get('suppress_warnings', []):
+        tube.supress_warning(warning)
+
+    if 'optimize' in entry:
+        try:
+            tube.optimize(**entry['optimize'])
+        except (TypeError, ValueError) as arg:
+            raise BuildError(name, f'manifest key "optimize" is invalid ({arg})')
+
+    if entry.get('openmp'):
+        tube.enable_openmp()
+
+    return tube
+
+
+def tubes_from_manifest(factory, filename: str) -> List:
+    manifest = load_manifest(filename)
+    folder = dirname(abspath(filename))
+
+    entries = manifest.get('tubes', []) if isinstance(manifest, dict) else None
+    if not isinstance(entries, list):
+        raise BuildError(filename, 'manifest "tubes" must be a list')
+
+    return [_tube_from_entry(factory, entry, folder) for entry in entries]
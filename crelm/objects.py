@@ -0,0 +1,212 @@
+from hashlib import sha256
+from os import environ, getpid, remove
+from shutil import rmtree
+from os.path import basename, exists, join as path_join, realpath
+from subprocess import run, PIPE, STDOUT
+from sysconfig import get_config_var
+from threading import Lock, get_ident
+from tempfile import gettempdir
+from typing import Dict, List, Tuple
+
+from .cache import BuildKey, compiler_version
+from .store import ArtifactStore
+
+_stats_lock = Lock()
+
+
+def parse_depfile(text: str) -> List[str]:
+    _, _, deps = text.replace('\\\n', ' ').partition(':')
+    return deps.split()
+
+
+def file_digest(filename: str) -> str:
+    try:
+        with open(filename, 'rb') as f:
+            return sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def compile_command(source: str, output: str, args: List[str], include_dirs: List[str]) -> List[str]:
+    return ['gcc'] + ObjectCache._base_flags() + \
+        [f'-I{x}' for x in include_dirs] + args + ['-o', output, source]
+
+
+class ObjectCache:
+    _OBJECT_FILENAME = 'object.o'
+    # foss: these only change the preprocessor output, which is hashed anyway
+    _PREPROCESSOR_FLAGS = ('-I', '-D', '-U')
+
+    def __init__(self, root: str = None, verbose: bool = False):
+        self._root = realpath(root if root else environ.get('CRELM_CACHE_DIR') or path_join(
+            gettempdir(), 'crelm', 'objects'))
+        self._store = ArtifactStore(path_join(self._root, 'store'))
+        self._verbose = verbose
+
+        self.hits = 0
+        self.misses = 0
+        self.preprocessed_hits = 0
+
+    @property
+    def store(self) -> ArtifactStore:
+        return self._store
+
+    @staticmethod
+    def _base_flags() -> List[str]:
+        return ['-c'] + \
+            get_config_var('CCSHARED').split() + \
+            get_config_var('CFLAGS').split()
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def stats(self) -> dict:
+        with _stats_lock:
+            stats = {
+                'hits': self.hits,
+                'direct_hits': self.hits - self.preprocessed_hits,
+                'preprocessed_hits': self.preprocessed_hits,
+                'misses': self.misses,
+            }
+
+        store = self._store.stats()
+        stats.update(root=self._root, entries=store['entries'], bytes=store['bytes'])
+
+        return stats
+
+    def _make_source_key(self, source: str, args: List[str]) -> str:
+        return BuildKey() \
+            .add_file('source', source) \
+            .add_texts('args', args) \
+            .add_text('compiler', compiler_version()) \
+            .digest
+
+    def _make_preprocessed_key(self, digest: str, args: List[str]) -> str:
+        return BuildKey() \
+            .add_text('preprocessed', digest) \
+            .add_texts('args', [x for x in args if not x.startswith(ObjectCache._PREPROCESSOR_FLAGS)]) \
+            .add_text('compiler', compiler_version()) \
+            .digest
+
+    def _object_filename(self, object_key: str) -> str:
+        return path_join(self._store.path(object_key), ObjectCache._OBJECT_FILENAME)
+
+    def _lookup(self, source_key: str) -> dict:
+        # manifests live in the store, so they are pruned with the objects
+        for entry in reversed(self._store.load_manifest(source_key)):
+            if all(digest == file_digest(dep) for dep, digest in entry['deps'].items()):
+                if self._store.lookup(entry['key']) and exists(self._object_filename(entry['key'])):
+                    return entry
+
+        return None
+
+    def _preprocess(self, source: str, args: List[str], report=None) -> Tuple[str, List[str]]:
+        # the preprocessed translation unit, without line markers, is the
+        # same wherever the source lives, so it keys objects across tubes
+        dep_filename = path_join(self._store.root, f'{getpid()}.{get_ident()}.d')
+
+        command = ['gcc'] + args + ['-E', '-P', '-MMD', '-MF', dep_filename, source]
+
+        if report:
+            report.add_command(command)
+
+        result = run(command, stdout=PIPE, stderr=PIPE)
+        if 0 != result.returncode:
+            print(result.stderr.decode())
+            return None, None
+
+        with open(dep_filename, 'rt') as f:
+            deps = [realpath(x) for x in parse_depfile(f.read())]
+
+        remove(dep_filename)
+
+        return sha256(result.stdout).hexdigest(), deps
+
+    def _compile(self, source: str, args: List[str], object_key: str, report=None) -> bool:
+        scratch = self._store.scratch(object_key)
+
+        command = ['gcc'] + args + \
+            ['-o', path_join(scratch, ObjectCache._OBJECT_FILENAME), source]
+
+        if self._verbose:
+            print(f'object cache miss: {" ".join(command)}')
+
+        if report:
+            report.add_command(command)
+
+        result = run(command, stdout=PIPE, stderr=STDOUT)
+        if 0 != result.returncode:
+            print(result.stdout.decode())
+            rmtree(scratch, ignore_errors=True)
+            return False
+
+        self._store.publish(object_key, basename(source), scratch)
+
+        return True
+
+    def compile(self, source: str, args: List[str], include_dirs: List[str], report=None,
+                deps: Dict[str, str] = None, direct: bool = True) -> str:
+        # deps, when given, is updated with the digests of every file the
+        # object was compiled from. Sources at throwaway paths pass
+        # direct=False, a manifest keyed on their path would never be read
+        source = realpath(source)
+        args = ObjectCache._base_flags() + \
+            [f'-I{x}' for x in include_dirs] + args
+
+        source_key = self._make_source_key(source, args)
+
+        entry = self._lookup(source_key) if direct else None
+
+        if entry:
+            object_key = entry['key']
+            if deps is not None:
+                deps.update(entry['deps'])
+
+            if report:
+                report.count('objects', True)
+
+            with _stats_lock:
+                self.hits += 1
+
+            if self._verbose:
+                print(f'object cache hit: {source} ({object_key})')
+
+            return self._object_filename(object_key)
+
+        digest, dependencies = self._preprocess(source, args, report)
+        if digest is None:
+            return None
+
+        object_key = self._make_preprocessed_key(digest, args)
+
+        # identical units compiled at the same time wait for the first one
+        with self._store.lock(object_key):
+            hit = self._store.lookup(object_key) is not None and \
+                exists(self._object_filename(object_key))
+
+            if report:
+                report.count('objects', hit)
+                report.count('preprocessed', hit)
+
+            with _stats_lock:
+                if hit:
+                    self.hits += 1
+                    self.preprocessed_hits += 1
+                else:
+                    self.misses += 1
+
+            if hit:
+                if self._verbose:
+                    print(f'object cache preprocessed hit: {source} ({object_key})')
+            elif not self._compile(source, args, object_key, report):
+                return None
+
+        dep_digests = {dep: file_digest(dep) for dep in dependencies}
+        if deps is not None:
+            deps.update(dep_digests)
+
+        if direct:
+            self._store.add_manifest_entry(source_key, object_key, dep_digests)
+
+        return self._object_filename(object_key)
@@ -0,0 +1,455 @@
+# foss: this module is copied verbatim into frozen packages (see freeze.py),
+# so it must not import anything from crelm or cffi's build-time modules.
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+# must match crelm.vectorize.VECTORIZED_PREFIX
+_VECTORIZED_PREFIX = 'crelm_vec_'
+
+_FLOAT_TYPES = ('float', 'double')
+
+_TYPECODES = {('f', 4): 'f', ('f', 8): 'd',
+              ('i', 1): 'b', ('i', 2): 'h', ('i', 4): 'i', ('i', 8): 'q',
+              ('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q',
+              ('c', 1): 'b'}
+
+_BYTE_FORMATS = ('B', 'b', 'c')
+
+
+def _ctype_kind(ffi, ctype) -> str:
+    if ctype.cname in _FLOAT_TYPES:
+        return 'f'
+
+    if 'char' == ctype.cname:
+        return 'c'
+
+    return 'i' if int(ffi.cast(ctype.cname, -1)) < 0 else 'u'
+
+
+def _format_kind(format: str) -> str:
+    format = format.lstrip('@=')
+
+    if format in ('e', 'f', 'd'):
+        return 'f'
+
+    if format in ('b', 'h', 'i', 'l', 'q', 'n'):
+        return 'i'
+
+    if format in ('B', 'H', 'I', 'L', 'Q', 'N', '?'):
+        return 'u'
+
+    return 'c' if 'c' == format else None
+
+
+def _is_numpy(obj) -> bool:
+    return type(obj).__module__.startswith('numpy')
+
+
+def _typecode(ffi, ctype) -> str:
+    typecode = _TYPECODES.get((_ctype_kind(ffi, ctype), ffi.sizeof(ctype))) \
+        if 'primitive' == ctype.kind else None
+
+    if not typecode:
+        raise TypeError(f'no array type for {ctype.cname}')
+
+    return typecode
+
+
+def _check_buffer(ffi, ctype, view):
+    size = ffi.sizeof(ctype)
+
+    # raw bytes (bytearray, mmap, ...) are untyped, so any whole number of
+    # items may live in them
+    if 1 == view.itemsize and view.format.lstrip('@=') in _BYTE_FORMATS and 1 != size:
+        if view.nbytes % size:
+            raise ValueError(
+                f'buffer of {view.nbytes} bytes does not hold a whole number of {ctype.cname}')
+        return
+
+    if view.itemsize != size:
+        raise TypeError(f'buffer of "{view.format}" does not match {ctype.cname}')
+
+    if 'primitive' == ctype.kind:
+        kind = _ctype_kind(ffi, ctype)
+        accepted = ('c', 'i', 'u') if 'c' == kind else (kind,)
+
+        if _format_kind(view.format) not in accepted:
+            raise TypeError(f'buffer of "{view.format}" does not match {ctype.cname}')
+
+
+def _c_array(ffi, ctype, obj, writable: bool = False):
+    view = memoryview(obj)
+
+    if not view.c_contiguous:
+        raise ValueError('buffer is not C contiguous')
+
+    _check_buffer(ffi, ctype, view)
+
+    return ffi.from_buffer(f'{ctype.cname}[]', obj, require_writable=writable), \
+        view.nbytes // ffi.sizeof(ctype)
+
+
+def _element(ffi, cdata, length: int):
+    ctype = ffi.typeof(cdata)
+
+    if ctype.kind not in ('array', 'pointer'):
+        raise TypeError(f'{ctype.cname} is not an array or pointer')
+
+    if length is None:
+        if 'pointer' == ctype.kind:
+            raise ValueError(f'length is needed for {ctype.cname}')
+        length = len(cdata)
+
+    return ctype.item, length
+
+
+def _numpy_dtype(numpy, ffi, ctype):
+    if 'primitive' == ctype.kind:
+        return numpy.dtype(_typecode(ffi, ctype))
+
+    if 'pointer' == ctype.kind:
+        return numpy.dtype(numpy.uintp)
+
+    if 'array' == ctype.kind and ctype.length is not None:
+        return numpy.dtype((_numpy_dtype(numpy, ffi, ctype.item), ctype.length))
+
+    if 'struct' == ctype.kind and ctype.fields is not None:
+        if any(-1 != field.bitsize for _, field in ctype.fields):
+            raise TypeError(f'{ctype.cname} has bit fields')
+
+        return numpy.dtype({
+            'names': [name for name, _ in ctype.fields],
+            'formats': [_numpy_dtype(numpy, ffi, field.type) for _, field in ctype.fields],
+            'offsets': [field.offset for _, field in ctype.fields],
+            'itemsize': ffi.sizeof(ctype)})
+
+    raise TypeError(f'no numpy dtype for {ctype.cname}')
+
+
+def _shape_length(shape) -> int:
+    length = 1
+    for x in shape:
+        length *= x
+    return length
+
+
+def _new_array(ffi, ctype, length: int, like_numpy: bool):
+    typecode = _typecode(ffi, ctype)
+
+    if like_numpy:
+        import numpy
+        return numpy.empty(length, dtype=typecode)
+
+    return array(typecode, bytes(length * ffi.sizeof(ctype)))
+
+
+class Vectorized:
+    def __init__(self, ffi, function, wrapper):
+        self._ffi = ffi
+        self._function = function
+        self._wrapper = wrapper
+
+        ctype = ffi.typeof(function)
+        self._args = ctype.args
+        self._result = ctype.result
+
+    def __call__(self, *args):
+        return self._function(*args)
+
+    def vec(self, *args, out=None):
+        if len(args) != len(self._args):
+            raise TypeError(
+                f'vec() takes {len(self._args)} arguments ({len(args)} given)')
+
+        wrapper_args = []
+        length = None
+        like_numpy = False
+
+        for arg, ctype in zip(args, self._args):
+            if 'primitive' != ctype.kind:
+                wrapper_args.append(arg)
+                continue
+
+            if isinstance(arg, (int, float)):
+                wrapper_args += [self._ffi.new(f'{ctype.cname}[1]', [arg]), 0]
+                continue
+
+            data, arg_length = _c_array(self._ffi, ctype, arg)
+
+            if length is not None and arg_length != length:
+                raise ValueError(
+                    f'vec() arrays differ in length ({length} and {arg_length})')
+
+            length = arg_length
+            like_numpy = like_numpy or _is_numpy(arg)
+            wrapper_args += [data, 1]
+
+        if length is None:
+            raise ValueError('vec() needs at least one array argument')
+
+        if 'void' != self._result.kind:
+            if out is None:
+                out = _new_array(self._ffi, self._result, length, like_numpy)
+
+            data, out_length = _c_array(self._ffi, self._result, out, writable=True)
+
+            if out_length < length:
+                raise ValueError(f'vec() out holds {out_length} of {length} results')
+
+            wrapper_args.append(data)
+
+        self._wrapper(*wrapper_args, length)
+
+        return out
+
+
+class Arena:
+    # foss: memory is carved from large zeroed blocks and only given back in
+    # bulk by reset(), pointers from new() are valid until then and must not
+    # outlive the arena
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, ffi, block_size: int = None):
+        self._ffi = ffi
+        self._block_size = block_size if block_size else Arena.DEFAULT_BLOCK_SIZE
+        self._layouts = {}
+        self._blocks = []
+        self._select(0)
+        self._allocations = 0
+        self._bytes_live = 0
+
+    def __enter__(self) -> 'Arena':
+        return self
+
+    def __exit__(self, *args):
+        self.reset()
+
+    def _select(self, block: int):
+        self._block = block
+        self._offset = 0
+        self._current = self._blocks[block] if block < len(self._blocks) else None
+        self._capacity = len(self._current) if self._current is not None else 0
+
+    def _allocate(self, size: int, alignment: int):
+        while self._block < len(self._blocks):
+            offset = -(-self._offset // alignment) * alignment
+
+            if offset + size <= self._capacity:
+                self._offset = offset + size
+                self._allocations += 1
+                self._bytes_live += size
+                return self._current + offset
+
+            self._select(self._block + 1)
+
+        self._blocks.append(self._ffi.new(
+            'char[]', max(size, self._block_size)))
+        self._select(len(self._blocks) - 1)
+
+        return self._allocate(size, alignment)
+
+    def _layout(self, typename: str) -> tuple:
+        ctype = self._ffi.typeof(typename)
+
+        layout = (self._ffi.typeof(f'{typename} *'),
+                  self._ffi.sizeof(ctype), self._ffi.alignof(ctype))
+        self._layouts[typename] = layout
+
+        return layout
+
+    def new(self, typename: str, count: int = 1):
+        pointer_type, size, alignment = self._layouts.get(
+            typename) or self._layout(typename)
+        size *= count
+
+        # fast path, the current block has room
+        offset = -(-self._offset // alignment) * alignment
+        if offset + size <= self._capacity:
+            self._offset = offset + size
+            self._allocations += 1
+            self._bytes_live += size
+            return self._ffi.cast(pointer_type, self._current + offset)
+
+        return self._ffi.cast(pointer_type, self._allocate(size, alignment))
+
+    def new_array(self, typename: str, count: int):
+        return self.new(typename, count)
+
+    def new_char_array(self, v):
+        if isinstance(v, str):
+            data = v.encode('utf-8')
+            pointer = self.new('char', len(data) + 1)
+            self._ffi.memmove(pointer, data, len(data))
+            return pointer
+
+        if isinstance(v, int):
+            return self.new('char', v)
+
+        return None
+
+    def reset(self):
+        # reused memory is zeroed again so that new() behaves like ffi.new()
+        for block in self._blocks[:self._block]:
+            self._ffi.memmove(block, bytes(len(block)), len(block))
+
+        if self._current is not None:
+            self._ffi.memmove(self._current, bytes(self._offset), self._offset)
+
+        self._select(0)
+        self._allocations = 0
+        self._bytes_live = 0
+
+    def release(self):
+        self._blocks = []
+        self.reset()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'blocks': len(self._blocks),
+            'bytes_allocated': sum(len(x) for x in self._blocks),
+            'bytes_live': self._bytes_live,
+            'allocations': self._allocations,
+        }
+
+
+_METHOD_NAMES = {}
+
+
+def _method_names(cls) -> tuple:
+    names = _METHOD_NAMES.get(cls)
+
+    if names is None:
+        names = _METHOD_NAMES[cls] = tuple(
+            name for name in dir(cls) if not name.startswith('_') and callable(getattr(cls, name)))
+
+    return names
+
+
+class Paste:
+    _OWN_ATTRIBUTES = ('_lib', '_ffi', '_tube')
+
+    def __init__(self, lib, ffi):
+        self._lib = lib
+        self._ffi = ffi
+
+        # __getattr__ is not asked for names the class defines, so C
+        # functions named like a helper are bound up front and win
+        for name in _method_names(type(self)):
+            if hasattr(lib, name):
+                self.__getattr__(name)
+
+    def __getattr__(self, name: str):
+        if name in Paste._OWN_ATTRIBUTES:
+            raise AttributeError(name)
+
+        value = getattr(self._lib, name)
+
+        # global variables are read through the lib on every access
+        if callable(value):
+            wrapper = getattr(self._lib, _VECTORIZED_PREFIX + name, None)
+            if wrapper is not None:
+                value = Vectorized(self._ffi, value, wrapper)
+
+            setattr(self, name, value)
+
+        return value
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(dir(self._lib)))
+
+    def new(self, typename: str):
+        return self._ffi.new(f"{typename} *")
+
+    def new_array(self, typename: str, v):
+        return self._ffi.new(f"{typename}[]", v)
+
+    def arena(self, block_size: int = None) -> Arena:
+        return Arena(self._ffi, block_size)
+
+    def split_buffer(self, typename: str, obj, parts: int, writable: bool = False) -> list:
+        pointer, length = _c_array(
+            self._ffi, self._ffi.typeof(typename), obj, writable)
+
+        size, remainder = divmod(length, parts)
+        chunks = []
+        start = 0
+
+        for i in range(parts):
+            count = size + (1 if i < remainder else 0)
+            if count:
+                chunks.append((pointer + start, count))
+            start += count
+
+        return chunks
+
+    def parallel_map(self, func, chunks, threads: int = None) -> list:
+        # cffi releases the GIL for the duration of each C call, so the
+        # chunks really do run at the same time
+        function = getattr(self, func) if isinstance(func, str) else func
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(lambda args: function(*args), chunks))
+
+    def new_char_array(self, v):
+        if isinstance(v, str):
+            return self._ffi.new(f"char[]", v.encode('utf-8'))
+
+        if isinstance(v, int):
+            return self._ffi.new(f"char[{v}]")
+
+        return None
+
+    def str(self, cstr) -> str:
+        return self._ffi.string(cstr).decode('utf-8')
+
+    def buffer(self, cdata, size: int = -1):
+        return self._ffi.buffer(cdata, size)
+
+    def from_buffer(self, typename: str, obj, writable: bool = False):
+        return _c_array(self._ffi, self._ffi.typeof(typename), obj, writable)[0]
+
+    def as_memoryview(self, cdata, length: int = None, shape: tuple = None) -> memoryview:
+        item, length = _element(self._ffi, cdata,
+                                _shape_length(shape) if shape else length)
+
+        return memoryview(self._ffi.buffer(cdata, length * self._ffi.sizeof(item))) \
+            .cast(_typecode(self._ffi, item), shape if shape else (length,))
+
+    def as_array(self, cdata, length: int = None, shape: tuple = None, dtype=None):
+        import numpy
+
+        item, length = _element(self._ffi, cdata,
+                                _shape_length(shape) if shape else length)
+        item_dtype = _numpy_dtype(numpy, self._ffi, item)
+
+        if dtype is not None and numpy.dtype(dtype) != item_dtype:
+            raise TypeError(f'dtype {numpy.dtype(dtype)} does not match {item.cname}')
+
+        return numpy.frombuffer(self._ffi.buffer(cdata, length * self._ffi.sizeof(item)),
+                                dtype=item_dtype).reshape(shape if shape else (length,))
+
+    @property
+    def null_pointer(self):
+        return self._ffi.NULL
+
+    @property
+    def typedef_names(self):
+        return self._ffi.list_types()[0]
+
+    @property
+    def struct_names(self):
+        return self._ffi.list_types()[1]
+
+    @property
+    def union_names(self):
+        return self._ffi.list_types()[2]
+
+    def typedef_decl(self, type_name: str, instance_name: str = ''):
+        return self._ffi.getctype(type_name, instance_name)
+
+    def function_decl(self, type_name: str, instance_name: str = ''):
+        return self.typedef_decl(type_name).replace('(*)', f' {instance_name}')
+
+    def struct_decl(self, type_name: str, instance_name: str = ''):
+        return self.typedef_decl(type_name)
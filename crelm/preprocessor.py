@@ -0,0 +1,42 @@
+from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+from typing import Iterable, Iterator, List
+
+
+def strip_lines(lines: Iterable[str], prefix: str) -> Iterator[str]:
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith(prefix):
+            yield line
+
+
+class Preprocessor:
+    def __init__(self, macros: List[str], include_dirs: List[str] = None, verbose: bool = False):
+        self._macros = macros
+        self._include_dirs = include_dirs if include_dirs else []
+        self._verbose = verbose
+
+    def command(self, filename: str, depfile: str = None) -> List[str]:
+        return ['gcc', '-w', '-E'] + \
+            [f'-D{macro}' for macro in self._macros] + \
+            [f'-I{x}' for x in self._include_dirs] + \
+            (['-MMD', '-MF', depfile] if depfile else []) + \
+            [filename]
+
+    def run(self, filename: str, depfile: str = None) -> str:
+        command = self.command(filename, depfile)
+
+        if self._verbose:
+            print(f'preprocess: {" ".join(command)}')
+
+        with TemporaryFile() as errors:
+            with Popen(command, stdout=PIPE, stderr=errors, text=True) as process:
+                output = '\n'.join(strip_lines(process.stdout, '#'))
+
+            if 0 != process.returncode:
+                if self._verbose:
+                    errors.seek(0)
+                    print(errors.read().decode())
+                return None
+
+        return output
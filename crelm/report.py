@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+from logging import getLogger
+from os.path import basename, getsize
+from resource import getrusage, RUSAGE_CHILDREN
+from threading import Lock
+from time import perf_counter, process_time, time
+from typing import List
+
+_hooks = []
+
+
+class BuildHook:
+    # foss: subclass and override what you need, every method is optional
+    def phase_started(self, report: 'BuildReport', phase: str):
+        pass
+
+    def phase_finished(self, report: 'BuildReport', phase: str, wall: float, cpu: float):
+        pass
+
+    def command_run(self, report: 'BuildReport', command: List[str]):
+        pass
+
+    def build_finished(self, report: 'BuildReport'):
+        pass
+
+
+class LoggingHook(BuildHook):
+    def __init__(self, logger=None):
+        self._logger = logger if logger else getLogger('crelm')
+
+    def phase_finished(self, report: 'BuildReport', phase: str, wall: float, cpu: float):
+        self._logger.debug(f'{report.name}: {phase} wall={wall:.3f}s cpu={cpu:.3f}s')
+
+    def command_run(self, report: 'BuildReport', command: List[str]):
+        self._logger.debug(f'{report.name}: {" ".join(command)}')
+
+    def build_finished(self, report: 'BuildReport'):
+        self._logger.info(str(report))
+
+
+def add_build_hook(hook: BuildHook):
+    _hooks.append(hook)
+
+
+def remove_build_hook(hook: BuildHook):
+    _hooks.remove(hook)
+
+
+def _cpu_time() -> float:
+    children = getrusage(RUSAGE_CHILDREN)
+    return process_time() + children.ru_utime + children.ru_stime
+
+
+class BuildReport:
+    def __init__(self, name: str, hooks: List[BuildHook] = None):
+        self.name = name
+        self.key = None
+        self.cache_hit = None
+        self.profile = None
+        self.pgo = None
+        self.error = None
+        self.started = time()
+        self.phases = {}
+        self.commands = []
+        self.caches = {}
+        self.artifacts = {}
+
+        self._hooks = list(_hooks) + (hooks if hooks else [])
+        self._lock = Lock()
+
+    def __getstate__(self) -> dict:
+        # hooks stay in the process that registered them
+        state = dict(self.__dict__)
+        del state['_hooks'], state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._hooks = []
+        self._lock = Lock()
+
+    def _emit(self, event: str, *args):
+        for hook in self._hooks:
+            getattr(hook, event)(self, *args)
+
+    @contextmanager
+    def phase(self, name: str):
+        self._emit('phase_started', name)
+
+        wall_start = perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield
+        finally:
+            wall = perf_counter() - wall_start
+            cpu = _cpu_time() - cpu_start
+
+            with self._lock:
+                phase = self.phases.setdefault(name, {'wall': 0, 'cpu': 0})
+                phase['wall'] += wall
+                phase['cpu'] += cpu
+
+            self._emit('phase_finished', name, wall, cpu)
+
+    def add_command(self, command: List[str]):
+        with self._lock:
+            self.commands.append(list(command))
+
+        self._emit('command_run', command)
+
+    def count(self, cache: str, hit: bool):
+        with self._lock:
+            counts = self.caches.setdefault(cache, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def add_artifact(self, filename: str):
+        try:
+            self.artifacts[basename(filename)] = getsize(filename)
+        except OSError:
+            pass
+
+    def merge(self, other: 'BuildReport') -> 'BuildReport':
+        with self._lock:
+            self.cache_hit = other.cache_hit
+
+            for name, phase in other.phases.items():
+                mine = self.phases.setdefault(name, {'wall': 0, 'cpu': 0})
+                mine['wall'] += phase['wall']
+                mine['cpu'] += phase['cpu']
+
+            for name, counts in other.caches.items():
+                mine = self.caches.setdefault(name, {'hits': 0, 'misses': 0})
+                mine['hits'] += counts['hits']
+                mine['misses'] += counts['misses']
+
+            self.commands += other.commands
+
+        return self
+
+    def finish(self, error: Exception = None) -> 'BuildReport':
+        if error:
+            self.error = str(error)
+
+        self._emit('build_finished')
+
+        return self
+
+    @property
+    def timings(self) -> dict:
+        return {name: phase['wall'] for name, phase in self.phases.items()}
+
+    @property
+    def wall(self) -> float:
+        return sum(phase['wall'] for phase in self.phases.values())
+
+    @property
+    def cpu(self) -> float:
+        return sum(phase['cpu'] for phase in self.phases.values())
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'key': self.key,
+            'cache_hit': self.cache_hit,
+            'profile': self.profile,
+            'pgo': self.pgo,
+            'error': self.error,
+            'started': self.started,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'phases': self.phases,
+            'commands': self.commands,
+            'caches': self.caches,
+            'artifacts': self.artifacts,
+        }
+
+    def __str__(self) -> str:
+        status = 'failed' if self.error else 'cached' if self.cache_hit else 'built'
+        phases = ', '.join(f'{name} {phase["wall"]:.3f}s/{phase["cpu"]:.3f}s'
+                           for name, phase in self.phases.items())
+
+        return f'{self.name}: {status} in {self.wall:.3f}s (cpu {self.cpu:.3f}s)' + \
+            (f' [{phases}]' if phases else '')
@@ -0,0 +1,316 @@
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX, LOCK_NB
+from functools import wraps
+from glob import glob
+from json import load as json_load, dump as json_dump
+from os import environ, fstat, getpid, makedirs, remove, rename, replace, stat, walk
+from os.path import basename, join as path_join, exists, getmtime, getsize, realpath
+from shutil import rmtree
+from tempfile import gettempdir, mkdtemp
+from threading import RLock, get_ident
+from time import time
+from typing import Dict, List
+
+_index_lock = RLock()
+
+
+def _locked(method):
+    # the thread lock keeps threads out, the file lock other processes, and
+    # only the outermost call takes the file lock since flock is per open file
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _index_lock:
+            if self._index_locked:
+                return method(self, *args, **kwargs)
+
+            with self._file_lock(ArtifactStore._INDEX_LOCK_FILENAME):
+                self._index_locked = True
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    self._index_locked = False
+    return wrapper
+
+
+class ArtifactStore:
+    _INDEX_FILENAME = 'index.json'
+    _INDEX_LOCK_FILENAME = 'index'
+    _LOCK_FOLDER = '.locks'
+    _MANIFEST_FOLDER = '.manifests'
+    _MAX_MANIFEST_ENTRIES = 8
+    _SCRATCH_SUFFIX = '.tmp'
+    _SCRATCH_MAX_AGE = 24 * 60 * 60
+
+    DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+    DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+    def __init__(self, root: str = None, max_bytes: int = None, max_age: float = None):
+        # generated sources include files by their path in the store, and
+        # gcc resolves a relative include from the including file
+        self._root = realpath(root if root else path_join(
+            gettempdir(), 'crelm', 'artifacts'))
+
+        self._max_bytes = max_bytes if max_bytes is not None else int(
+            environ.get('CRELM_CACHE_MAX_BYTES', ArtifactStore.DEFAULT_MAX_BYTES))
+
+        self._max_age = max_age if max_age is not None else float(
+            environ.get('CRELM_CACHE_MAX_AGE', ArtifactStore.DEFAULT_MAX_AGE))
+
+        self._index_locked = False
+
+        makedirs(path_join(self._root, ArtifactStore._LOCK_FOLDER), exist_ok=True)
+        makedirs(path_join(self._root, ArtifactStore._MANIFEST_FOLDER), exist_ok=True)
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def _lock_filename(self, name: str) -> str:
+        return path_join(self._root, ArtifactStore._LOCK_FOLDER, name + '.lock')
+
+    @contextmanager
+    def _file_lock(self, name: str):
+        filename = self._lock_filename(name)
+
+        while True:
+            with open(filename, 'a') as f:
+                flock(f.fileno(), LOCK_EX)
+
+                # prune removes idle lock files, one that went while this
+                # process waited for it no longer locks anything
+                try:
+                    current = fstat(f.fileno()).st_ino == stat(filename).st_ino
+                except FileNotFoundError:
+                    current = False
+
+                if current:
+                    yield
+                    return
+
+    def _prune_locks(self):
+        # only lock files nobody holds are removed, a process that opened
+        # one just before sees it has gone in _file_lock and opens it again
+        index_lock = self._lock_filename(ArtifactStore._INDEX_LOCK_FILENAME)
+
+        for filename in glob(self._lock_filename('*')):
+            if filename == index_lock:
+                continue
+
+            try:
+                with open(filename, 'a') as f:
+                    flock(f.fileno(), LOCK_EX | LOCK_NB)
+                    remove(filename)
+            except OSError:
+                pass
+
+    @contextmanager
+    def lock(self, key: str):
+        # serializes builds of one key across threads and processes, the
+        # lock is released when the file is closed
+        with self._file_lock(key):
+            yield
+
+    def scratch(self, key: str) -> str:
+        # a private folder on the same file system, so publish can rename it
+        return mkdtemp(prefix=f'{key}.', suffix=ArtifactStore._SCRATCH_SUFFIX, dir=self._root)
+
+    def discard_scratch(self, key: str):
+        # a build killed while it held the key's lock leaves its scratch
+        # folder behind, once the lock is free nobody else can be using it
+        with self.lock(key):
+            for scratch in glob(path_join(self._root, f'{key}.*' + ArtifactStore._SCRATCH_SUFFIX)):
+                rmtree(scratch, ignore_errors=True)
+
+    @property
+    def _index_filename(self) -> str:
+        return path_join(self._root, ArtifactStore._INDEX_FILENAME)
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_filename, 'rt') as f:
+                return json_load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict):
+        temp_filename = f'{self._index_filename}.{getpid()}.{get_ident()}.tmp'
+
+        with open(temp_filename, 'wt') as f:
+            json_dump(index, f, indent=1, sort_keys=True)
+
+        replace(temp_filename, self._index_filename)
+
+    @staticmethod
+    def _folder_size(folder: str) -> int:
+        return sum(getsize(path_join(dirpath, filename))
+                   for dirpath, _, filenames in walk(folder)
+                   for filename in filenames)
+
+    def path(self, key: str) -> str:
+        return path_join(self._root, key)
+
+    def _manifest_filename(self, key: str) -> str:
+        return path_join(self._root, ArtifactStore._MANIFEST_FOLDER, key + '.json')
+
+    def load_manifest(self, key: str) -> list:
+        # a manifest lists the artifacts built for one key, each with the
+        # digests of the files it was built from
+        try:
+            with open(self._manifest_filename(key), 'rt') as f:
+                return json_load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save_manifest(self, key: str, manifest: list):
+        filename = self._manifest_filename(key)
+
+        if not manifest:
+            try:
+                remove(filename)
+            except OSError:
+                pass
+            return
+
+        temp_filename = f'{filename}.{getpid()}.{get_ident()}.tmp'
+
+        with open(temp_filename, 'wt') as f:
+            json_dump(manifest[-ArtifactStore._MAX_MANIFEST_ENTRIES:], f)
+
+        replace(temp_filename, filename)
+
+    @_locked
+    def add_manifest_entry(self, key: str, artifact: str, deps: Dict[str, str]):
+        manifest = [x for x in self.load_manifest(key) if x['key'] != artifact]
+        manifest.append({'key': artifact, 'deps': deps})
+        self._save_manifest(key, manifest)
+
+    def _prune_manifests(self, index: dict):
+        for filename in glob(path_join(self._root, ArtifactStore._MANIFEST_FOLDER, '*.json')):
+            key = basename(filename)[:-len('.json')]
+            manifest = self.load_manifest(key)
+            live = [x for x in manifest if x['key'] in index]
+
+            if len(live) != len(manifest):
+                self._save_manifest(key, live)
+
+    @_locked
+    def lookup(self, key: str) -> dict:
+        index = self._load_index()
+
+        entry = index.get(key)
+        if not entry:
+            return None
+
+        if not exists(self.path(key)):
+            del index[key]
+            self._save_index(index)
+            return None
+
+        entry['accessed'] = time()
+        self._save_index(index)
+
+        return entry
+
+    def latest(self, name: str) -> str:
+        entries = [(entry['accessed'], key) for key, entry
+                   in self._load_index().items() if name == entry['name']]
+
+        return max(entries)[1] if entries else None
+
+    def _move_into_place(self, key: str, scratch: str):
+        target = self.path(key)
+
+        if exists(target):
+            stale = self.scratch(key)
+            rmtree(stale)
+            rename(target, stale)
+            rename(scratch, target)
+            rmtree(stale, ignore_errors=True)
+        else:
+            rename(scratch, target)
+
+    @_locked
+    def publish(self, key: str, name: str, scratch: str = None) -> dict:
+        if scratch:
+            self._move_into_place(key, scratch)
+
+        now = time()
+
+        index = self._load_index()
+        index[key] = {
+            'name': name,
+            'bytes': ArtifactStore._folder_size(self.path(key)),
+            'created': now,
+            'accessed': now,
+        }
+        self._save_index(index)
+
+        # the caller is about to use what it published, even if it alone
+        # is over the cap
+        self.prune(keep=key)
+
+        return index[key]
+
+    @_locked
+    def discard(self, key: str):
+        index = self._load_index()
+        if key in index:
+            del index[key]
+            self._save_index(index)
+
+        rmtree(self.path(key), ignore_errors=True)
+
+    @_locked
+    def prune(self, max_bytes: int = None, max_age: float = None, keep: str = None) -> List[str]:
+        max_bytes = self._max_bytes if max_bytes is None else max_bytes
+        max_age = self._max_age if max_age is None else max_age
+
+        index = self._load_index()
+        oldest_first = sorted(index.items(), key=lambda x: x[1]['accessed'])
+
+        total_bytes = sum(entry['bytes'] for _, entry in oldest_first)
+        expiry = time() - max_age
+
+        removed = []
+        for key, entry in oldest_first:
+            if entry['accessed'] >= expiry and total_bytes <= max_bytes:
+                break
+
+            if key == keep:
+                continue
+
+            removed.append(key)
+            total_bytes -= entry['bytes']
+            del index[key]
+            rmtree(self.path(key), ignore_errors=True)
+
+        if removed:
+            self._save_index(index)
+            self._prune_manifests(index)
+
+        # scratch folders are only left behind by builds that were killed
+        for scratch in glob(path_join(self._root, '*' + ArtifactStore._SCRATCH_SUFFIX)):
+            try:
+                if getmtime(scratch) < time() - ArtifactStore._SCRATCH_MAX_AGE:
+                    rmtree(scratch, ignore_errors=True)
+            except OSError:
+                pass
+
+        self._prune_locks()
+
+        return removed
+
+    def clear(self) -> List[str]:
+        return self.prune(max_bytes=0)
+
+    def stats(self) -> dict:
+        index = self._load_index()
+
+        return {
+            'root': self._root,
+            'entries': len(index),
+            'bytes': sum(entry['bytes'] for entry in index.values()),
+            'max_bytes': self._max_bytes,
+            'max_age': self._max_age,
+            'names': sorted(set(entry['name'] for entry in index.values())),
+        }
@@ -1,12 +1,30 @@
-from os.path import dirname, realpath, join as path_join, exists
-from os import remove, mkdir
-from pexpect import run as pexpect_run
-from tempfile import gettempdir
-from typing import List, TypeVar
+from os.path import basename, dirname, realpath, join as path_join, exists
+from os import makedirs, remove, mkdir, cpu_count
+from asyncio import CancelledError, Semaphore
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from shutil import rmtree
+from glob import glob
+from subprocess import run, PIPE, STDOUT
+from time import perf_counter
+from typing import Callable, Dict, List, TypeVar
 from cffi import FFI
-from importlib import import_module, reload
 
+from .cache import BuildKey, compiler_version, crelm_version, native_arch, openmp_supported
+from .cdefs import CdefCache
+from .errors import BuildError
 from .factory import Factory
+from .freeze import module_filename, write_package, write_wheel
+from .headers import HeaderCache, declaration_skeleton
+from .loader import load_extension, module_name
+from .objects import ObjectCache, compile_command, file_digest, parse_depfile
+from .paste import Paste
+from .preprocessor import Preprocessor, strip_lines
+from .report import BuildHook, BuildReport
+from .store import ArtifactStore
+from .vectorize import vectorized_wrapper
+from .watch import LivePaste, Watcher
+from .worker import build_in_subprocess
 
 TSelf = TypeVar('TSelf', bound='Tube')
 
@@ -14,6 +32,16 @@ TSelf = TypeVar('TSelf', bound='Tube')
 class Tube:
     _GENERATED_FILENAME_BASE = 'crelm_generated'
     _PREPROCESSOR_FILENAME_BASE = 'crelm_cpp'
+    _CDEF_FILENAME = 'crelm_cdef.h'
+    _HEADER_DEPS_FILENAME = 'amalgamated_headers.d'
+    _OPTIMIZATION_LEVELS = ('O0', 'O1', 'O2', 'O3', 'Os', 'Og', 'Ofast')
+    _PGO_DUMP_FILENAME = 'crelm_pgo_dump.c'
+    # foss: a dump marks the profile written, so the exit handler leaves
+    # the file alone. A reset clears that mark, it has to come first
+    _PGO_DUMP_DECLARATION = 'void crelm_pgo_reset(void);\nvoid crelm_pgo_dump(void);'
+    _PGO_DUMP_SOURCE = 'void __gcov_dump(void);\nvoid __gcov_reset(void);\n' \
+        'void crelm_pgo_reset(void) { __gcov_reset(); }\n' \
+        'void crelm_pgo_dump(void) { __gcov_dump(); }\n'
 
     def __init__(self, name: str):
         self._name = name
@@ -28,14 +56,26 @@ class Tube:
         self._header_text = ''
         self._macros = []
         self._externs = []
+        self._vectorized = []
         self._compiler_args = []
+        self._link_args = []
+        self._profile = None
+        self._pgo_mode = None
+        self._pgo_folder = None
+        self._watcher = None
+        self._dependencies = {}
+        self._openmp = False
         self._lib_path = None
-        self._temp_folderbame = path_join(gettempdir(), 'crelm')
-        self._gen_foldername = path_join(self._temp_folderbame, name)
+        self._cache_hit = None
+        self._report = BuildReport(name)
+        self._hooks = []
+        self._store = None
+        self._object_cache = None
+        self._header_cache = None
+        self._cdef_cache = None
+        self._gen_foldername = None
         self._verbose = False
-
-        if not exists(self._temp_folderbame):
-            mkdir(self._temp_folderbame)
+        self._jobs = None
 
     @ property
     def _preprocessor_source_filename(self) -> str:
@@ -56,6 +96,15 @@ class Tube:
     def _module_name(self):
         return f'lib{self._name}'
 
+    @ property
+    def _all_header_filenames(self) -> List[str]:
+        return self._header_filenames + \
+            [self._make_gen_filename(self._generated_header_filename)]
+
+    @ property
+    def cache_hit(self) -> bool:
+        return self._cache_hit
+
     def _make_gen_filename(self, filename: str) -> str:
         return path_join(self._gen_foldername, filename)
 
@@ -97,54 +146,83 @@ class Tube:
     def compile_defines(self) -> str:
         return ' '.join([f'-D{macro}' for macro in self._macros])
 
+    @ property
+    def report(self) -> BuildReport:
+        return self._report
+
+    @ property
+    def timings(self) -> dict:
+        return self._report.timings
+
+    def _timed(self, phase: str):
+        return self._report.phase(phase)
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state['_hooks'] = []
+        state['_watcher'] = None
+        # a loaded module stays in the process that loaded it
+        state.pop('_lib', None)
+        state.pop('_ffi', None)
+        return state
+
     def _preprocess_text(self, source: str, strip_includes: bool = False) -> str:
         if strip_includes:
-            source = '\n'.join(
-                [line.strip() for line in source.split('\n') if not line.startswith('#include')]).strip()
+            source = '\n'.join(strip_lines(source.split('\n'), '#include'))
 
         self._save_file(self._preprocessor_source_filename, source)
 
         filename = self._make_gen_filename(self._preprocessor_source_filename)
-        command = f'gcc -w -E {self.compile_defines} {filename}'
 
-        output, status = pexpect_run(command, withexitstatus=True)
-        if status != 0:
-            if self._verbose:
-                print(output.decode())
-            return None
-
-        lines = output.decode().split('\n')
+        preprocessor = Preprocessor(self._macros, verbose=self._verbose)
+        self._report.add_command(preprocessor.command(filename))
 
-        return '\n'.join(
-            [line.strip() for line in lines if not line.startswith('#')]).strip()
+        with self._timed('preprocess_source'):
+            return preprocessor.run(filename)
 
     def _preprocess_headers(self) -> str:
-
         headers = '\n'.join(
-            [f'#include "{x}"' for x in self._header_filenames])
+            [f'#include "{x}"' for x in self._all_header_filenames])
 
-        include_dirs = ' '.join([f'-I {x}' for x in self._include_dirs])
-                                
         amalgamated_header_filename = self._make_gen_filename(
             'amalgamated_headers.h')
 
         with open(amalgamated_header_filename, 'wt') as f:
             f.write(headers)
 
-        command = f'gcc -w -E {self.compile_defines} {include_dirs} {amalgamated_header_filename}'
-        if self._verbose:
-            print(f'_preprocess_headers: {command}')
+        preprocessor = Preprocessor(
+            self._macros, self._include_dirs, verbose=self._verbose)
+        depfile = self._make_gen_filename(Tube._HEADER_DEPS_FILENAME)
+        self._report.add_command(preprocessor.command(
+            amalgamated_header_filename, depfile))
 
-        output, status = pexpect_run(command, withexitstatus=True)
-        if status != 0:
-            if self._verbose:
-                print(output.decode())
-            return None
+        with self._timed('preprocess_headers'):
+            return preprocessor.run(amalgamated_header_filename, depfile)
+
+    def _header_dependencies(self) -> Dict[str, str]:
+        try:
+            deps = parse_depfile(self._load_file(Tube._HEADER_DEPS_FILENAME))
+        except OSError:
+            return {}
+
+        gen_folder = realpath(self._gen_foldername)
+
+        return {dep: file_digest(dep) for dep in map(realpath, deps)
+                if dirname(dep) != gen_folder}
 
-        lines = output.decode().split('\n')
+    def _make_header_key(self, preprocessed_source: str) -> str:
+        skeleton = declaration_skeleton(
+            preprocessed_source) if preprocessed_source else ''
 
-        return '\n'.join(
-            [line.strip() for line in lines if not line.startswith('#')]).strip()
+        return BuildKey() \
+            .add_text('skeleton', skeleton) \
+            .add_text('header_text', self._header_text) \
+            .add_texts('header_files', self._header_filenames) \
+            .add_texts('macros', self._macros) \
+            .add_texts('include_dirs', self._include_dirs) \
+            .add_text('compiler', compiler_version()) \
+            .add_text('crelm', crelm_version()) \
+            .digest
 
     def _generate(self) -> bool:
         self._create_gen_folder()
@@ -154,40 +232,52 @@ class Tube:
         self._save_file(self._generated_source_filename,
                         self._source_text + '\n')
 
-        if 0 != len(self._source_text):
+        header_text = self._header_text
+        text = None
 
-            if 0 == len(self._header_text):
-                text = self._preprocess_text(
-                    self._source_text, strip_includes=True)
+        # the generated header is preprocessed along with the header files
+        # in _preprocess_headers, so only makeheaders needs a separate pass
+        if 0 != len(self._source_text) and 0 == len(header_text):
+            text = self._preprocess_text(
+                self._source_text, strip_includes=True)
 
-                self._header_text = Factory().create_LibCrelm().make(text)
+            if text is None:
+                raise BuildError(self._name, 'Failed to preprocess source')
 
-                if self._verbose:
-                    print(
-                        f'makeheaders: {self._source_text} -> {self._header_text}')
-            else:
-                self._header_text = self._preprocess_text(self._header_text)
+        header_key = self._make_header_key(text)
+        cached = self.header_cache.lookup(header_key)
+        self._report.count('headers', cached is not None)
 
-                self._save_file(self._generated_header_filename,
-                                self._header_text + '\n')
+        if cached:
+            header_text, self._cdef = cached
+            self._dependencies.update(self.header_cache.dependencies(header_key))
+        elif text is not None:
+            with self._timed('makeheaders'):
+                header_text = Factory().create_LibCrelm().make(text)
 
-        if len(self._header_text):
-            self._header_text = self._preprocess_text(self._header_text)
+            if self._verbose:
+                print(
+                    f'makeheaders: {self._source_text} -> {header_text}')
 
-            self._save_file(self._generated_header_filename,
-                            self._header_text + '\n')
-        else:
-            self._save_file(self._generated_header_filename,
-                            self._header_text + '\n')
+        self._save_file(self._generated_header_filename,
+                        header_text + '\n')
 
-        self._header_filenames += [
-            self._make_gen_filename(self._generated_header_filename)]
+        if not cached:
+            self._cdef = self._preprocess_headers()
 
-        self._cdef = self._preprocess_headers()
+            if self._cdef is None:
+                raise BuildError(self._name, 'Failed to preprocess headers')
+
+            header_dependencies = self._header_dependencies()
+            self._dependencies.update(header_dependencies)
+            self.header_cache.save(header_key, header_text, self._cdef,
+                                   header_dependencies)
 
         extern_python = '\n'.join(self._externs)
         self._cdef += '\n' + extern_python
 
+        self._save_file(Tube._CDEF_FILENAME, self._cdef)
+
         if self._verbose:
             print(f'cdef: {self._cdef}')
 
@@ -195,45 +285,230 @@ class Tube:
 
     def _build_headers(self) -> str:
         headers = '\n'.join(
-            [f'#include "{x}"' for x in self._header_filenames])
+            [f'#include "{x}"' for x in self._all_header_filenames])
 
         return headers
 
+    def _profile_args(self) -> List[str]:
+        if not self._profile:
+            return []
+
+        return [f'-{self._profile["level"]}'] + \
+            (['-march=native'] if self._profile['native'] else []) + \
+            (['-ffast-math'] if self._profile['fast_math'] else []) + \
+            (['-flto=auto'] if self._profile['lto'] else [])
+
     def _build_compiler_args(self) -> List[str]:
-        args = self._compiler_args
-        args += [f'-D{x}' for x in self._macros]
-        return args
+        return self._compiler_args + \
+            self._profile_args() + \
+            [f'-D{x}' for x in self._macros]
+
+    def _build_link_args(self) -> List[str]:
+        # with LTO the code is generated at link time, so the profile has to
+        # be repeated there
+        lto = self._profile and self._profile['lto']
+        return self._link_args + \
+            (self._profile_args() if lto else []) + \
+            (['-fprofile-generate'] if 'generate' == self._pgo_mode else [])
+
+    def _pgo_args(self) -> List[str]:
+        if 'generate' == self._pgo_mode:
+            return ['-fprofile-generate', '-fprofile-update=prefer-atomic']
+
+        if 'use' == self._pgo_mode:
+            return ['-fprofile-use', '-fprofile-correction', '-Wno-missing-profile']
+
+        return []
+
+    def _make_build_key(self) -> str:
+        return BuildKey() \
+            .add_text('module', self._module_name) \
+            .add_text('source_text', self._source_text) \
+            .add_files('source_files', self._source_filenames) \
+            .add_text('header_text', self._header_text) \
+            .add_files('header_files', self._header_filenames) \
+            .add_texts('macros', self._macros) \
+            .add_texts('compiler_args', self._compiler_args) \
+            .add_texts('link_args', self._link_args) \
+            .add_texts('profile', self._profile_args()) \
+            .add_text('pgo', self._pgo_mode or '') \
+            .add_text('native_arch', native_arch() if self._profile and self._profile['native'] else '') \
+            .add_texts('include_dirs', self._include_dirs) \
+            .add_texts('externs', self._externs) \
+            .add_texts('vectorized', self._vectorized) \
+            .add_text('compiler', compiler_version()) \
+            .add_text('crelm', crelm_version()) \
+            .digest
+
+    def _module_exists(self) -> bool:
+        return module_filename(self._gen_foldername, self._module_name) is not None
+
+    def _lookup_artifact(self, key: str) -> dict:
+        # the build key only covers the files given to the tube, the headers
+        # they include are checked against the digests of the last builds
+        store = self.artifact_store
+
+        for entry in reversed(store.load_manifest(key)):
+            if all(digest == file_digest(dep) for dep, digest in entry['deps'].items()):
+                if store.lookup(entry['key']):
+                    return entry
+
+        return None
+
+    def _is_cached(self, key: str) -> bool:
+        entry = self._lookup_artifact(key)
+        if not entry:
+            return False
+
+        artifact = entry['key']
+        self._dependencies = dict(entry['deps'])
+        self._gen_foldername = self.artifact_store.path(artifact)
+        self._report.key = artifact
+
+        if not self._module_exists():
+            return False
+
+        try:
+            self._cdef = self._load_file(Tube._CDEF_FILENAME)
+        except OSError:
+            return False
+
+        return True
+
+    def _compile_objects(self, args: List[str]) -> List[str]:
+        cache = self.object_cache
+
+        generated = self._make_gen_filename(self._generated_source_filename)
+
+        def compile(source_filename: str) -> str:
+            # the generated source is in a scratch folder, only the
+            # preprocessed lookup can find it again
+            return cache.compile(source_filename, args, self._include_dirs, self._report,
+                                 self._dependencies, direct=source_filename != generated)
+
+        with ThreadPoolExecutor(max_workers=self._jobs or cpu_count()) as executor:
+            objects = list(executor.map(compile, [generated] + self._source_filenames))
+
+        return None if None in objects else objects
 
-    def _build(self) -> bool:
+    def _compile_pgo_objects(self, args: List[str]) -> List[str]:
+        # gcc matches a profile by the object and the source file names, so
+        # the instrumented and the optimized build compile the same paths
+        makedirs(self._pgo_folder, exist_ok=True)
+
+        generated = {self._generated_source_filename: self._source_text + '\n'}
+        if 'generate' == self._pgo_mode:
+            generated[Tube._PGO_DUMP_FILENAME] = Tube._PGO_DUMP_SOURCE
+
+        for filename, text in generated.items():
+            with open(path_join(self._pgo_folder, filename), 'wt') as f:
+                f.write(text)
+
+        sources = [path_join(self._pgo_folder, x) for x in generated]
+        sources[1:1] = self._source_filenames
+
+        args = args + self._pgo_args()
+
+        # the profile is an input of the optimized build, a retrained one
+        # gives a new artifact rather than reusing the loaded module
+        if 'use' == self._pgo_mode:
+            self._dependencies.update({realpath(x): file_digest(x) for x in
+                                       glob(path_join(self._pgo_folder, '*.gcda'))})
+
+        def compile(indexed) -> str:
+            index, source = indexed
+            output = path_join(self._pgo_folder,
+                               f'{index}_{basename(source).rsplit(".", 1)[0]}.o')
+
+            dep_filename = output[:-2] + '.d'
+            command = compile_command(source, output, args, self._include_dirs) + \
+                ['-MMD', '-MF', dep_filename]
+            self._report.add_command(command)
+
+            result = run(command, stdout=PIPE, stderr=STDOUT)
+            if 0 != result.returncode:
+                print(result.stdout.decode())
+                return None
+
+            with open(dep_filename, 'rt') as f:
+                self._dependencies.update({dep: file_digest(dep) for dep in map(
+                    realpath, parse_depfile(f.read())) if dirname(dep) != realpath(self._pgo_folder)})
+
+            return output
+
+        with ThreadPoolExecutor(max_workers=self._jobs or cpu_count()) as executor:
+            objects = list(executor.map(compile, enumerate(sources)))
+
+        return None if None in objects else objects
+
+    def _add_pgo_dump(self, ffibuilder) -> str:
+        if 'generate' != self._pgo_mode:
+            return ''
+
+        ffibuilder.cdef(Tube._PGO_DUMP_DECLARATION)
+
+        return '\n' + Tube._PGO_DUMP_DECLARATION
+
+    def _add_vectorized_wrappers(self, ffibuilder) -> str:
+        if not self._vectorized:
+            return ''
+
+        try:
+            wrappers = [vectorized_wrapper(ffibuilder, x)
+                        for x in self._vectorized]
+        except ValueError as arg:
+            raise BuildError(self._name, str(arg))
+
+        cdef = '\n'.join(x[0] for x in wrappers)
+        ffibuilder.cdef(cdef)
+
+        self._cdef += '\n' + cdef
+        self._save_file(Tube._CDEF_FILENAME, self._cdef)
+
+        return '\n' + '\n'.join(x[1] for x in wrappers)
+
+    def _build(self):
         self._delete_file(self._module_name)
+        self._dependencies = {}
 
         if self._verbose:
             print(f'header_text: {self._header_text}')
             print(f'source_text: {self._source_text}')
 
         if 0 == (len(self._source_filenames) + len(self._source_text)):
-            print(f'{self._name}: No sources specified')
-            return False
+            raise BuildError(self._name, 'No sources specified')
 
         if 0 != len(self._source_filenames) and 0 == (len(self._header_filenames) + len(self._header_text)):
-            print(f'{self._name}: Source file supplied without header')
-            return False
+            raise BuildError(self._name, 'Source file supplied without header')
 
-        if not self._generate():
-            print(f'{self._name}: Failed to generate')
-            return False
+        if self._openmp and not openmp_supported():
+            raise BuildError(self._name, 'OpenMP is not supported by the compiler')
 
-        source_filenames = self._source_filenames + \
-            [self._make_gen_filename(self._generated_source_filename)]
+        if not self._generate():
+            raise BuildError(self._name, 'Failed to generate')
 
         headers = self._build_headers()
         args = self._build_compiler_args()
 
+        # the generated source is compiled with the other objects, so cffi
+        # only compiles its own module source
+        source_filenames = []
+
+        with self._timed('compile_objects'):
+            if self._pgo_mode:
+                objects = self._compile_pgo_objects(args)
+            else:
+                objects = self._compile_objects(args)
+
+        if objects is None:
+            raise BuildError(self._name, 'Compilation failed')
+
         if self._verbose:
             print(f'module: {self._module_name}')
             print(f'cdef: {self._cdef}')
             print(f'headers: {headers}')
             print(f'sources: {source_filenames}')
+            print(f'objects: {objects}')
             print(f'include dirs: {self._include_dirs}')
             print(f'externs: {self._externs}')
             print(f'args: {args}')
@@ -243,46 +518,114 @@ class Tube:
         ffibuilder = FFI()
 
         try:
-            ffibuilder.cdef(self._cdef)
+            with self._timed('cdef'):
+                self._report.count(
+                    'cdef', self.cdef_cache.apply(ffibuilder, self._cdef))
         except BaseException as arg:
             print(self._cdef)
-            print(f'{self._name}: invalid cdef ({arg})')
-            return False
+            raise BuildError(self._name, f'invalid cdef ({arg})')
+
+        headers += self._add_vectorized_wrappers(ffibuilder)
+        headers += self._add_pgo_dump(ffibuilder)
 
         ffibuilder.set_source(self._module_name,
                               headers,
                               sources=source_filenames,
+                              extra_objects=objects,
                               extra_compile_args=args,
+                              extra_link_args=self._build_link_args(),
                               libraries=[],
                               include_dirs=self._include_dirs,
                               library_dirs=[],
                               )
 
         try:
-            self._lib_path = ffibuilder.compile(
-                tmpdir=self._gen_foldername,
-                verbose=self._verbose)
+            with self._timed('compile'):
+                self._lib_path = ffibuilder.compile(
+                    tmpdir=self._gen_foldername,
+                    verbose=self._verbose)
         except BaseException as arg:
-            print(f'{self._name}: Compilation failed ({arg})')
-            return False
+            raise BuildError(self._name, f'Compilation failed ({arg})')
 
         if self._verbose:
             print(f'lib: {self._lib_path}')
 
-        return True
+    def add_hook(self, hook: BuildHook) -> TSelf:
+        self._hooks.append(hook)
+        return self
 
     def verbose(self, v: bool = True) -> TSelf:
         self._verbose = v
         return self
 
+    def jobs(self, n: int = None) -> TSelf:
+        self._jobs = n
+        return self
+
     def supress_warning(self, warning: str) -> TSelf:
         self._compiler_args.append(f'-Wno-{warning}')
         return self
 
+    def optimize(self, level: str = 'O2', native: bool = False, lto: bool = False,
+                 fast_math: bool = False) -> TSelf:
+        if level not in Tube._OPTIMIZATION_LEVELS:
+            raise ValueError(f'unknown optimization level {level}')
+
+        self._profile = {'level': level, 'native': native,
+                         'lto': lto, 'fast_math': fast_math}
+        return self
+
+    def enable_openmp(self) -> TSelf:
+        if not self._openmp:
+            self._openmp = True
+            self._compiler_args.append('-fopenmp')
+            self._link_args.append('-fopenmp')
+        return self
+
     def save_compiler_temps(self) -> TSelf:
         self._compiler_args.append('-save-temps=obj')
         return self
 
+    @ property
+    def artifact_store(self) -> ArtifactStore:
+        if not self._store:
+            self._store = ArtifactStore()
+        return self._store
+
+    def set_artifact_store(self, store: ArtifactStore) -> TSelf:
+        self._store = store
+        return self
+
+    @ property
+    def object_cache(self) -> ObjectCache:
+        if not self._object_cache:
+            self._object_cache = ObjectCache(verbose=self._verbose)
+        return self._object_cache
+
+    def set_object_cache(self, cache: ObjectCache) -> TSelf:
+        self._object_cache = cache
+        return self
+
+    @ property
+    def header_cache(self) -> HeaderCache:
+        if not self._header_cache:
+            self._header_cache = HeaderCache(verbose=self._verbose)
+        return self._header_cache
+
+    def set_header_cache(self, cache: HeaderCache) -> TSelf:
+        self._header_cache = cache
+        return self
+
+    @ property
+    def cdef_cache(self) -> CdefCache:
+        if not self._cdef_cache:
+            self._cdef_cache = CdefCache(verbose=self._verbose)
+        return self._cdef_cache
+
+    def set_cdef_cache(self, cache: CdefCache) -> TSelf:
+        self._cdef_cache = cache
+        return self
+
     def set_gen_folder(self, path: str) -> TSelf: # todo foss: something about this
         # self._gen_foldername = path
         return self
@@ -373,95 +716,318 @@ class Tube:
         self._externs.append(f'extern "Python" {extern}')
         return self
 
+    def add_vectorized(self, name: str) -> TSelf:
+        self._vectorized.append(name)
+        return self
+
     def add_externs(self, externs: List[str]) -> TSelf:
         for extern in externs:
             self.add_extern(extern)
 
         return self
 
-    class Paste:
+    class Paste(Paste):
         def __init__(self, tube: TSelf):
-
+            super().__init__(tube._lib, tube._ffi)
             self._tube = tube
 
-            for attr in dir(self._tube._lib):
-                self.__setattr__(attr, getattr(self._tube._lib, attr))
-
         @ classmethod
         def choose(cls, name: str, path=None):
             return Tube(name) \
                 .set_gen_folder(path if path else '') \
                 .squeeze(build=False)
 
-        def new(self, typename: str):
-            return self._tube._ffi.new(f"{typename} *")
+    def _prepare(self, build: bool) -> str:
+        store = self.artifact_store
+        self._report = BuildReport(self._name, self._hooks)
+
+        key = self._make_build_key() if build else store.latest(self._name)
+        if not key:
+            raise BuildError(self._name, f'no artifact found in {store.root}')
 
-        def new_char_array(self, v):
-            if isinstance(v, str):
-                return self._tube._ffi.new(f"char[]", v.encode('utf-8'))
+        self._gen_foldername = store.path(key)
+        self._report.key = key
+        self._report.profile = self._report_profile()
 
-            if isinstance(v, int):
-                return self._tube._ffi.new(f"char[{v}]")
+        return key
 
+    def _report_profile(self) -> dict:
+        if not self._profile:
             return None
 
-        def str(self, cstr) -> str:
-            return self._tube._ffi.string(cstr).decode('utf-8')
+        profile = dict(self._profile)
+        profile['args'] = self._profile_args()
+        if profile['native']:
+            profile['arch'] = native_arch()
 
-        @property
-        def null_pointer(self):
-            return self._tube._ffi.NULL
+        return profile
 
-        @property
-        def typedef_names(self):
-            return self._tube._ffi.list_types()[0]
+    def _record_artifacts(self):
+        self._report.add_artifact(module_filename(
+            self._gen_foldername, self._module_name) or self._module_name)
+        self._report.add_artifact(self._make_gen_filename(Tube._CDEF_FILENAME))
 
-        @property
-        def struct_names(self):
-            return self._tube._ffi.list_types()[1]
+    def _build_cached(self) -> TSelf:
+        store = self.artifact_store
 
-        @property
-        def union_names(self):
-            return self._tube._ffi.list_types()[2]
+        key = self._prepare(build=True)
+        self._cache_hit = self._is_cached(key)
+        self._report.cache_hit = self._cache_hit
 
-        def typedef_decl(self, type_name: str, instance_name: str = ''):
-            return self._tube._ffi.getctype(type_name, instance_name)
+        if self._verbose:
+            print(
+                f'{self._name}: build cache {"hit" if self._cache_hit else "miss"} ({key})')
 
-        def function_decl(self, type_name: str, instance_name: str = ''):
-            return self.typedef_decl(type_name).replace('(*)', f' {instance_name}')
+        if self._cache_hit:
+            self._record_artifacts()
+            return self
 
-        def struct_decl(self, type_name: str, instance_name: str = ''):
-            return self.typedef_decl(type_name)
+        with store.lock(key):
+            # another process may have built it while this one waited
+            if self._is_cached(key):
+                self._cache_hit = self._report.cache_hit = True
+                self._record_artifacts()
+                return self
 
-    def squeeze(self, build: bool = True) -> TSelf:
-        if build:
-            try:
-                if not self._build():
-                    print(f'{self._name}: build failed')
-                    return None
-            except BaseException as arg:
-                print(f'{self._name}: build failed ({arg})')
-                return None
+            self._build_in_scratch(key)
+
+        self._record_artifacts()
+
+        return self
+
+    def _build_in_scratch(self, key: str):
+        # nothing is written to the published folder, a finished build is
+        # renamed into place so readers never see a half written module
+        store = self.artifact_store
+        scratch = store.scratch(key)
+
+        self._gen_foldername = scratch
+        try:
+            self._build()
+        except BuildError:
+            rmtree(scratch, ignore_errors=True)
+            raise
+        except Exception as arg:
+            rmtree(scratch, ignore_errors=True)
+            raise BuildError(self._name, f'build failed ({arg})') from arg
+
+        # files generated into the scratch folder are covered by the key
+        scratch = realpath(scratch)
+        deps = {dep: digest for dep, digest in self._dependencies.items()
+                if dirname(dep) != scratch}
+        self._dependencies = deps
+
+        artifact = BuildKey() \
+            .add_text('build', key) \
+            .add_texts('deps', [f'{k}={v}' for k, v in sorted(deps.items())]) \
+            .digest
+
+        self._gen_foldername = store.path(artifact)
+        self._report.key = artifact
+
+        store.publish(artifact, self._name, scratch)
+        store.add_manifest_entry(key, artifact, deps)
+
+    def build(self) -> TSelf:
+        try:
+            self._build_cached()
+        except BuildError as arg:
+            self._report.finish(arg)
+            raise
+
+        self._report.finish()
+
+        return self
+
+    async def _build_async(self, semaphore: Semaphore = None) -> TSelf:
+        key = self._prepare(build=True)
+        self._cache_hit = self._is_cached(key)
+        self._report.cache_hit = self._cache_hit
+
+        if self._cache_hit:
+            self._record_artifacts()
+            return self
+
+        try:
+            if semaphore:
+                async with semaphore:
+                    report = await build_in_subprocess(self)
+            else:
+                report = await build_in_subprocess(self)
+        except CancelledError:
+            self.artifact_store.discard_scratch(key)
+            raise
+
+        self._build_cached()
+        key = self._report.key
+
+        # the build itself ran in the worker, so keep its phases rather than
+        # the cache hit that loading it here produced
+        self._report = BuildReport(self._name, self._hooks).merge(report)
+        self._report.key = key
+        self._report.profile = self._report_profile()
+        self._record_artifacts()
+
+        return self
+
+    def freeze(self, folder: str, package: str = None) -> str:
+        self.build()
+
+        return write_package(folder,
+                             package if package else self._name,
+                             self._name,
+                             module_filename(self._gen_foldername,
+                                             self._module_name),
+                             self._cdef,
+                             basename(self._gen_foldername))
 
-        from sys import path
-        path.append(self._gen_foldername)
+    def freeze_wheel(self, folder: str, package: str = None, version: str = '0.0.0') -> str:
+        return write_wheel(self.freeze(folder, package), folder, version)
+
+    def _load(self) -> 'Tube.Paste':
+        filename = module_filename(self._gen_foldername, self._module_name)
 
         if self._verbose:
-            print(f'loading module {self._module_name} from {self._gen_foldername}...')
+            print(f'loading module {self._module_name} from {filename}...')
+
+        if not filename:
+            raise BuildError(self._name, f'Unable to load module (not found in {self._gen_foldername})')
 
         try:
-            module = import_module(self._module_name)
-        except BaseException as arg:
-            print(f'{self._name}: Unable to load module ({arg})')
-            return None
+            with self._timed('load'):
+                module, loaded = load_extension(filename, module_name(
+                    basename(self._gen_foldername), self._module_name))
+        except Exception as arg:
+            raise BuildError(self._name, f'Unable to load module ({arg})') from arg
+
+        self._report.count('modules', loaded)
+
+        if self._verbose:
+            print(self._report)
 
-        reload(module)
         self._lib = module.lib
         self._ffi = module.ffi
 
-        paste = Tube.Paste(self)
+        return Tube.Paste(self)
+
+    def squeeze(self, build: bool = True) -> TSelf:
+        try:
+            if build:
+                self._build_cached()
+            else:
+                self._prepare(build=False)
+
+            paste = self._load()
+        except BuildError as arg:
+            self._report.finish(arg)
+            print(arg)
+            return None
+
+        self._report.finish()
+
+        return paste
+
+    def _train_pgo(self, training: Callable) -> dict:
+        # the instrumented variant gets its own module name, it would clash
+        # with the optimized module when both are loaded in one process
+        for filename in glob(path_join(self._pgo_folder, '*.gcda')):
+            remove(filename)
+
+        instrumented = copy(self)
+        instrumented._name = f'{self._name}_pgo'
+        instrumented._pgo_mode = 'generate'
+        instrumented._build_cached()
+        paste = instrumented._load()
+        paste.crelm_pgo_reset()
+
+        start = perf_counter()
+        training(paste)
+        elapsed = perf_counter() - start
+
+        paste.crelm_pgo_dump()
+
+        # the instrumented module is only good for one training run
+        instrumented.artifact_store.discard(instrumented.report.key)
+
+        return {'instrumented_build': instrumented.report.wall,
+                'instrumented_training': elapsed}
+
+    def squeeze_pgo(self, training: Callable, retrain: bool = False, compare: bool = False) -> TSelf:
+        # training is called with the instrumented Paste, the profile it
+        # leaves behind is kept in the artifact store next to the optimized
+        # build, so it is capped and pruned like any other entry
+        try:
+            self._pgo_mode = None
+            profile_key = BuildKey().add_text('pgo', self._make_build_key()).digest
+            self._pgo_folder = self.artifact_store.path(profile_key)
+            self._pgo_mode = 'use'
+
+            pgo = {'trained': False,
+                   'instrumented_build': None,
+                   'instrumented_training': None,
+                   'optimized_training': None}
+
+            key = self._prepare(build=True)
+
+            # the profile folder is shared, so one process trains at a time
+            with self.artifact_store.lock(key + '.pgo'):
+                cached = self._is_cached(key)
+                if retrain or not cached:
+                    if cached:
+                        self.artifact_store.discard(self._report.key)
+                    pgo.update(self._train_pgo(training), trained=True)
+
+                self._build_cached()
+
+                if exists(self._pgo_folder):
+                    self.artifact_store.publish(profile_key, f'{self._name}_pgo')
+
+            paste = self._load()
+
+            if compare:
+                start = perf_counter()
+                training(paste)
+                pgo['optimized_training'] = perf_counter() - start
+        except BuildError as arg:
+            self._report.finish(arg)
+            print(arg)
+            return None
+
+        self._report.pgo = pgo
+        self._report.finish()
+
+        return paste
+
+    def watch(self, interval: float = 0.5) -> LivePaste:
+        # rebuilds on a background thread when a source or header file
+        # changes, unchanged files come from the object cache
+        self.unwatch()
+
+        paste = self.squeeze()
+        if paste is None:
+            return None
+
+        self._watcher = Watcher(self, paste, interval).start()
+
+        return self._watcher.paste
+
+    def unwatch(self) -> TSelf:
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+
+        return self
+
+    async def squeeze_async(self, semaphore: Semaphore = None) -> TSelf:
+        try:
+            await self._build_async(semaphore)
+
+            paste = self._load()
+        except BuildError as arg:
+            self._report.finish(arg)
+            print(arg)
+            return None
 
-        if not paste:
-            print(f'{self._name}: paste is None')
+        self._report.finish()
 
         return paste
@@ -0,0 +1,56 @@
+from typing import Tuple
+
+from cffi import model
+
+# foss: paste.py looks for this prefix at runtime, keep the two in step
+VECTORIZED_PREFIX = 'crelm_vec_'
+
+
+def vectorized_wrapper(ffi, name: str) -> Tuple[str, str]:
+    # numeric arguments become (pointer, step) pairs so that a scalar can be
+    # broadcast with a step of 0, pointer arguments are passed through as is
+    declaration = ffi._parser._declarations.get(f'function {name}')
+    if not declaration:
+        raise ValueError(f'vectorized function {name} is not declared')
+
+    function = declaration[0]
+
+    if function.ellipsis:
+        raise ValueError(f'vectorized function {name} is variadic')
+
+    if not isinstance(function.result, (model.PrimitiveType, model.VoidType)):
+        raise ValueError(f'vectorized function {name} must return a number or void')
+
+    params = []
+    call_args = []
+
+    for i, arg in enumerate(function.args):
+        if isinstance(arg, model.PrimitiveType):
+            params += [f'{arg.name} const *a{i}', f'size_t a{i}_step']
+            call_args.append(f'a{i}[i * a{i}_step]')
+        elif isinstance(arg, model.PointerType):
+            params.append(arg.get_c_name(f' a{i}'))
+            call_args.append(f'a{i}')
+        else:
+            raise ValueError(
+                f'vectorized function {name} takes unsupported argument {arg.get_c_name()}')
+
+    call = f'{name}({", ".join(call_args)})'
+
+    if isinstance(function.result, model.VoidType):
+        body = f'{call};'
+    else:
+        params.append(f'{function.result.name} *out')
+        body = f'out[i] = {call};'
+
+    params.append('size_t n')
+
+    signature = f'void {VECTORIZED_PREFIX}{name}({", ".join(params)})'
+
+    source = '\n'.join([f'{signature} {{',
+                        '  size_t i;',
+                        '  for (i = 0; i < n; ++i)',
+                        f'    {body}',
+                        '}'])
+
+    return signature + ';', source
@@ -0,0 +1,138 @@
+from asyncio import run
+from copy import copy
+from os import stat
+from threading import Event, Thread, current_thread
+from typing import Dict, List
+
+from .errors import BuildError
+
+
+def snapshot(filenames: List[str]) -> Dict[str, tuple]:
+    state = {}
+
+    for filename in filenames:
+        try:
+            info = stat(filename)
+            state[filename] = (info.st_mtime_ns, info.st_size)
+        except OSError:
+            state[filename] = None
+
+    return state
+
+
+class LivePaste:
+    # foss: every attribute is looked up on the current Paste, take
+    # .current once when several calls must use the same build
+    _OWN_ATTRIBUTES = ('_paste', '_watcher')
+
+    def __init__(self, paste, watcher: 'Watcher'):
+        self._paste = paste
+        self._watcher = watcher
+
+    def __getattr__(self, name: str):
+        if name in LivePaste._OWN_ATTRIBUTES:
+            raise AttributeError(name)
+
+        return getattr(self._paste, name)
+
+    def __dir__(self):
+        return dir(self._paste)
+
+    def __enter__(self) -> 'LivePaste':
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def current(self):
+        return self._paste
+
+    @property
+    def generation(self) -> int:
+        return self._watcher.generation
+
+    @property
+    def error(self) -> BuildError:
+        return self._watcher.error
+
+    def stop(self):
+        self._watcher.stop()
+
+
+class Watcher:
+    def __init__(self, tube, paste, interval: float):
+        self._tube = tube
+        self._interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name=f'crelm-watch-{tube._name}', daemon=True)
+        self._built_tube = tube
+
+        self._built = snapshot(self.filenames)
+        self._pending = self._built
+
+        self.generation = 0
+        self.error = None
+        self.paste = LivePaste(paste, self)
+
+    @property
+    def filenames(self) -> List[str]:
+        # the files given to the tube and every header the last good build
+        # included, a failed build keeps watching the same headers
+        tube = self._tube
+        return sorted(set(tube._source_filenames + tube._header_filenames +
+                          list(self._built_tube._dependencies)))
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.poll()
+
+    def start(self) -> 'Watcher':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread.is_alive() and self._thread is not current_thread():
+            self._thread.join()
+
+    def poll(self) -> bool:
+        # a change is only built once the files have stopped changing for
+        # one interval, so a half saved file is not compiled
+        state = snapshot(self.filenames)
+        stable = state == self._pending
+        self._pending = state
+
+        if not stable or state == self._built:
+            return False
+
+        self._built = state
+
+        # cffi changes the working directory of the whole process while it
+        # compiles, so the build runs in a worker process. It works on a
+        # copy, the watched tube itself is never changed by this thread
+        tube = copy(self._tube)
+        tube._hooks = self._tube._hooks
+
+        try:
+            run(tube._build_async())
+            tube._report.finish()
+            paste = tube._load()
+        except BuildError as arg:
+            tube._report.finish(arg)
+            self.error = arg
+            print(arg)
+            return False
+
+        # the rebuild may include other headers, the ones it already saw
+        # keep the state it was built from
+        self._built_tube = tube
+        self._built = self._pending = {filename: state.get(filename, info)
+                                       for filename, info in snapshot(self.filenames).items()}
+
+        self.error = None
+        self.paste._paste = paste
+        self.generation += 1
+
+        return True
@@ -0,0 +1,71 @@
+from asyncio import CancelledError, create_subprocess_exec
+from asyncio.subprocess import PIPE
+from os import dup, dup2, environ, fdopen, killpg, pathsep
+from os.path import dirname, realpath
+from pickle import dumps, loads, load, dump
+from signal import SIGKILL
+from sys import executable, stdin
+
+from .errors import BuildError
+
+# foss: crelm imports this module, so running it with -m would import it a
+# second time and warn about it
+_WORKER_CODE = 'from sys import exit; from crelm.worker import main; exit(main())'
+
+
+def _worker_environment() -> dict:
+    package_root = dirname(dirname(realpath(__file__)))
+    python_path = environ.get('PYTHONPATH')
+
+    env = dict(environ)
+    env['PYTHONPATH'] = pathsep.join(
+        [package_root, python_path] if python_path else [package_root])
+
+    return env
+
+
+async def build_in_subprocess(tube):
+    # pickle first, so a tube that cannot be sent never starts a worker
+    try:
+        data = dumps(tube)
+    except Exception as arg:
+        raise BuildError(tube._name, f'cannot send tube to build worker ({arg})') from arg
+
+    process = await create_subprocess_exec(executable, '-c', _WORKER_CODE,
+                                           stdin=PIPE, stdout=PIPE,
+                                           env=_worker_environment(),
+                                           start_new_session=True)
+
+    try:
+        output, _ = await process.communicate(data)
+    except CancelledError:
+        killpg(process.pid, SIGKILL)
+        await process.wait()
+        raise
+
+    if 0 != process.returncode or not output:
+        raise BuildError(tube._name, f'build worker exited with {process.returncode}')
+
+    error, report = loads(output)
+    if error:
+        raise error
+
+    return report
+
+
+def main() -> int:
+    result = fdopen(dup(1), 'wb')
+    dup2(2, 1)
+
+    tube = load(stdin.buffer)
+
+    try:
+        tube.build()
+        error = None
+    except BuildError as arg:
+        error = arg
+
+    with result:
+        dump((error, tube.report), result)
+
+    return 0
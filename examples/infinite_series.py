@@ -1,3 +1,4 @@
+from array import array
 from timeit import timeit
 from crelm import Tube
 
@@ -56,8 +57,14 @@ class InfiniteSeries:
         return self
 
     def _run(self):
+        run = self._paste.infinite_series_run
+
+        if hasattr(run, 'vec'):
+            self.result = list(run.vec(self._state, array('L', self._xaxis)))
+            return self
+
         for x in self._xaxis:
-            p = self._paste.infinite_series_run(self._state, int(x))
+            p = run(self._state, int(x))
             self.result.append(p)
         return self
 
@@ -36,18 +36,26 @@ class PiInfiniteSeries(InfiniteSeries):
         x_axis = PlotAxis(1, PiInfiniteSeries.number_of_iterations,
                           100).fill_log().smooth().get()
 
-        paste = factory.create_Tube(f'infinite_series_{self.name}') \
-            .set_source_folder_relative(__file__) \
-            .add_header_file('pi.h') \
-            .add_source_file('pi.c') \
-            .add_macros([f'USE_{self._algorithm.name}',  f'USE_{self._type.name}']) \
-            .add_macro_if(BugType.OVERFLOW == self._bug, f'USE_OVERFLOW_BUG') \
-            .squeeze()
+        paste = PiInfiniteSeries.make_tube(type, algorithm, bug).squeeze()
 
         state = paste.new('struct infinite_series_state_t')
 
         super().__init__(paste, state, x_axis, PiInfiniteSeries._PI_REFERENCE)
 
+    @staticmethod
+    def make_name(type: AccumulatorType, algorithm: AlgorithmType, bug: BugType = BugType.NONE) -> str:
+        return f'{algorithm.name}_{type.name}{"_OVERFLOW" if BugType.OVERFLOW==bug else ""}'
+
+    @staticmethod
+    def make_tube(type: AccumulatorType, algorithm: AlgorithmType, bug: BugType = BugType.NONE):
+        return factory.create_Tube(f'infinite_series_{PiInfiniteSeries.make_name(type, algorithm, bug)}') \
+            .set_source_folder_relative(__file__) \
+            .add_header_file('pi.h') \
+            .add_source_file('pi.c') \
+            .add_macros([f'USE_{algorithm.name}',  f'USE_{type.name}']) \
+            .add_macro_if(BugType.OVERFLOW == bug, f'USE_OVERFLOW_BUG') \
+            .add_vectorized('infinite_series_run')
+
     @property
     def type(self) -> AccumulatorType:
         return self._type
@@ -58,66 +66,78 @@ class PiInfiniteSeries(InfiniteSeries):
 
     @ property
     def name(self) -> str:
-        return f'{self._algorithm.name}_{self._type.name}{"_OVERFLOW" if BugType.OVERFLOW==self._bug else ""}'
+        return PiInfiniteSeries.make_name(self._type, self._algorithm, self._bug)
 
     @property
     def bug(self) -> BugType:
         return self._bug
 
 
-PiInfiniteSeries.number_of_iterations = BigNumbers.billions(1)
-
-series = [PiInfiniteSeries(type=AccumulatorType.FLOAT,
-                           algorithm=AlgorithmType.LEIBNIZ),
-          PiInfiniteSeries(type=AccumulatorType.DOUBLE,
-                           algorithm=AlgorithmType.LEIBNIZ),
-          PiInfiniteSeries(type=AccumulatorType.FLOAT,
-                           algorithm=AlgorithmType.NILAKANTHA),
-          PiInfiniteSeries(type=AccumulatorType.DOUBLE,
-                           algorithm=AlgorithmType.NILAKANTHA),
-          PiInfiniteSeries(type=AccumulatorType.FLOAT,
-                           algorithm=AlgorithmType.EULER),
-          PiInfiniteSeries(type=AccumulatorType.DOUBLE,
-                           algorithm=AlgorithmType.EULER),
-          PiInfiniteSeries(type=AccumulatorType.DOUBLE,
-                           algorithm=AlgorithmType.NILAKANTHA, bug=BugType.OVERFLOW)]
-
-print(
-    f"running {len(series)} algorithms over {PiInfiniteSeries.number_of_iterations} iterations")
-[x.init().run().analyse().report() for x in series]
-
-plot_colours = {AlgorithmType.LEIBNIZ: 'blue',
-                AlgorithmType.NILAKANTHA: 'red',
-                AlgorithmType.EULER: 'yellow'}
-
-plot_linestyles = {(AccumulatorType.FLOAT, BugType.NONE,): 'dashed',
-                   (AccumulatorType.DOUBLE, BugType.NONE,): None,
-                   (AccumulatorType.FLOAT, BugType.OVERFLOW,): 'dotted',
-                   (AccumulatorType.DOUBLE, BugType.OVERFLOW,): 'dotted'}
-
-fig, (estimates, errors,) = plt.subplots(1, 2)
-
-[estimates.plot(a._xaxis, a.result, label=a.name,
-                linestyle=plot_linestyles[(a.type, a.bug,)],
-                color=plot_colours[a.algorithm]) for a in series]
-estimates.set_xscale('log')
-estimates.set_ylim([2.75, 3.5])
-estimates.set_title('Pi Estimates')
-estimates.set_xlabel('Number of iterations (log)')
-estimates.set_ylabel('Estimate')
-estimates.legend(loc="lower right")
-
-[errors.plot(a._xaxis, a.diff, label=a.name,
-             linestyle=plot_linestyles[(a.type, a.bug,)],
-             color=plot_colours[a.algorithm]) for a in series]
-errors.set_xscale('log')
-errors.set_yscale('log')
-errors.set_title('Pi Errors')
-errors.set_xlabel('Number of iterations (log)')
-errors.set_ylabel('Absolute error (log)')
-
-plt.subplots_adjust(left=0.06, right=0.97, top=0.94, bottom=0.1)
-fig.set_size_inches((10.24, 7.68,))
-
-plt.savefig("pi.png", dpi=100)
-plt.show()
+def main():
+    # squeeze_all builds in worker processes, which import this file again
+    # under the spawn and forkserver start methods
+    PiInfiniteSeries.number_of_iterations = BigNumbers.billions(1)
+
+    variants = [dict(type=AccumulatorType.FLOAT,
+                     algorithm=AlgorithmType.LEIBNIZ),
+                dict(type=AccumulatorType.DOUBLE,
+                     algorithm=AlgorithmType.LEIBNIZ),
+                dict(type=AccumulatorType.FLOAT,
+                     algorithm=AlgorithmType.NILAKANTHA),
+                dict(type=AccumulatorType.DOUBLE,
+                     algorithm=AlgorithmType.NILAKANTHA),
+                dict(type=AccumulatorType.FLOAT,
+                     algorithm=AlgorithmType.EULER),
+                dict(type=AccumulatorType.DOUBLE,
+                     algorithm=AlgorithmType.EULER),
+                dict(type=AccumulatorType.DOUBLE,
+                     algorithm=AlgorithmType.NILAKANTHA, bug=BugType.OVERFLOW)]
+
+    print(f"building {len(variants)} tubes in parallel")
+    factory.squeeze_all([PiInfiniteSeries.make_tube(**x) for x in variants])
+
+    series = [PiInfiniteSeries(**x) for x in variants]
+
+    print(
+        f"running {len(series)} algorithms over {PiInfiniteSeries.number_of_iterations} iterations")
+    [x.init().run().analyse().report() for x in series]
+
+    plot_colours = {AlgorithmType.LEIBNIZ: 'blue',
+                    AlgorithmType.NILAKANTHA: 'red',
+                    AlgorithmType.EULER: 'yellow'}
+
+    plot_linestyles = {(AccumulatorType.FLOAT, BugType.NONE,): 'dashed',
+                       (AccumulatorType.DOUBLE, BugType.NONE,): None,
+                       (AccumulatorType.FLOAT, BugType.OVERFLOW,): 'dotted',
+                       (AccumulatorType.DOUBLE, BugType.OVERFLOW,): 'dotted'}
+
+    fig, (estimates, errors,) = plt.subplots(1, 2)
+
+    [estimates.plot(a._xaxis, a.result, label=a.name,
+                    linestyle=plot_linestyles[(a.type, a.bug,)],
+                    color=plot_colours[a.algorithm]) for a in series]
+    estimates.set_xscale('log')
+    estimates.set_ylim([2.75, 3.5])
+    estimates.set_title('Pi Estimates')
+    estimates.set_xlabel('Number of iterations (log)')
+    estimates.set_ylabel('Estimate')
+    estimates.legend(loc="lower right")
+
+    [errors.plot(a._xaxis, a.diff, label=a.name,
+                 linestyle=plot_linestyles[(a.type, a.bug,)],
+                 color=plot_colours[a.algorithm]) for a in series]
+    errors.set_xscale('log')
+    errors.set_yscale('log')
+    errors.set_title('Pi Errors')
+    errors.set_xlabel('Number of iterations (log)')
+    errors.set_ylabel('Absolute error (log)')
+
+    plt.subplots_adjust(left=0.06, right=0.97, top=0.94, bottom=0.1)
+    fig.set_size_inches((10.24, 7.68,))
+
+    plt.savefig("pi.png", dpi=100)
+    plt.show()
+
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,46 @@
+from os.path import join as path_join
+from shutil import rmtree
+
+from cffi import FFI
+
+from crelm.cdefs import CdefCache
+
+from john import TestCase
+
+
+class CdefCacheTests(TestCase):
+    _CDEF = '''
+typedef struct node_t { int value; struct node_t *next; } node_t;
+typedef int (*visit_t)(node_t *);
+enum colour { RED, GREEN = 5 };
+int walk(node_t *head, visit_t visit);
+'''
+
+    def setUp(self):
+        super().setUp()
+        root = path_join(self.tempFolder, 'cdefs')
+        rmtree(root, ignore_errors=True)
+        self.sut = CdefCache(root)
+
+    def test_first_apply_is_miss(self):
+        self.assertFalse(self.sut.apply(FFI(), self._CDEF))
+        self.assertEqual(1, self.sut.misses)
+
+    def test_second_apply_is_hit(self):
+        self.sut.apply(FFI(), self._CDEF)
+
+        self.assertTrue(self.sut.apply(FFI(), self._CDEF))
+        self.assertEqual(1, self.sut.hits)
+
+    def test_hit_restores_declarations(self):
+        expected = FFI()
+        expected.cdef(self._CDEF)
+
+        self.sut.apply(FFI(), self._CDEF)
+        actual = FFI()
+        self.sut.apply(actual, self._CDEF)
+
+        self.assertEqual(sorted(expected._parser._declarations),
+                         sorted(actual._parser._declarations))
+        self.assertEqual(expected._parser._int_constants,
+                         actual._parser._int_constants)
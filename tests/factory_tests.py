@@ -1,6 +1,9 @@
+from asyncio import run
+
 from crelm.factory import Factory
 from crelm.libcrelm import LibCrelm
 from crelm.tube import Tube
+from crelm.errors import BuildError
 
 from john import TestCase
 
@@ -19,3 +22,47 @@ class FactoryTests(TestCase):
         actual = sut.create_Tube('test')
 
         self.assertTrue(isinstance(actual, Tube))
+
+    def test_squeeze_all_returns_pastes_in_order(self):
+        sut = Factory(path='factory_test')
+
+        tubes = [sut.create_Tube(f'{self.testName}_{i}')
+                 .add_source_text(f'int test_squeeze_all() {{ return {i}; }}')
+                 for i in range(3)]
+
+        actual = [paste.test_squeeze_all() for paste in sut.squeeze_all(tubes, workers=2)]
+
+        self.assertEqual([0, 1, 2], actual)
+
+    def test_squeeze_all_after_squeeze_of_changed_tube(self):
+        sut = Factory(path='factory_test')
+        tube = sut.create_Tube(self.testName).add_source_text('int squeezed() { return 1; }')
+        tube.squeeze()
+
+        tube.add_source_text('int squeezed_again() { return 2; }')
+        actual = sut.squeeze_all([tube])
+
+        self.assertEqual(2, actual[0].squeezed_again())
+
+    def test_squeeze_all_returns_errors_per_tube(self):
+        sut = Factory(path='factory_test')
+
+        tubes = [sut.create_Tube(f'{self.testName}_good').add_source_text('int good() { return 1; }'),
+                 sut.create_Tube(f'{self.testName}_bad').add_source_text('this wont compile')]
+
+        actual = sut.squeeze_all(tubes)
+
+        self.assertEqual(1, actual[0].good())
+        self.assertTrue(isinstance(actual[1], BuildError))
+        self.assertEqual(f'{self.testName}_bad', actual[1].name)
+
+    def test_squeeze_all_async_returns_pastes_and_errors_in_order(self):
+        sut = Factory(path='factory_test')
+
+        tubes = [sut.create_Tube(f'{self.testName}_good').add_source_text('int good_async() { return 1; }'),
+                 sut.create_Tube(f'{self.testName}_bad').add_source_text('this wont compile')]
+
+        actual = run(sut.squeeze_all_async(tubes, workers=2))
+
+        self.assertEqual(1, actual[0].good_async())
+        self.assertTrue(isinstance(actual[1], BuildError))
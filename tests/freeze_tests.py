@@ -0,0 +1,78 @@
+from os import makedirs
+from os.path import exists, join as path_join
+from subprocess import run, PIPE
+from sys import executable
+from zipfile import ZipFile
+
+from crelm import BuildError, Factory
+
+from john import TestCase
+
+
+class FreezeTests(TestCase, Factory):
+
+    def make_tube(self):
+        return self.create_Tube('frozen_add') \
+            .add_source_text('int frozen_add(int a, int b) { return a + b; }')
+
+    def run_python(self, code: str, path: str) -> str:
+        result = run([executable, '-S', '-c', code], stdout=PIPE, stderr=PIPE,
+                     env={'PYTHONPATH': path + ':' + self.site_packages()})
+        self.assertEqual(0, result.returncode, result.stderr.decode())
+        return result.stdout.decode().strip()
+
+    def site_packages(self) -> str:
+        import cffi
+        return path_join(cffi.__file__, '..', '..')
+
+    def test_frozen_package_imports_without_crelm(self):
+        folder = path_join(self.tempFolder, 'frozen')
+        self.make_tube().freeze(folder)
+
+        actual = self.run_python(
+            'import sys, frozen_add; print(frozen_add.frozen_add(2, 3), "crelm" in sys.modules, "pycparser" in sys.modules)',
+            folder)
+
+        self.assertEqual('5 False False', actual)
+
+    def test_frozen_package_load_returns_paste(self):
+        folder = path_join(self.tempFolder, 'frozen')
+        self.make_tube().freeze(folder, package='frozen_loader')
+
+        actual = self.run_python(
+            'import frozen_loader; print(frozen_loader.load().frozen_add(4, 5))', folder)
+
+        self.assertEqual('9', actual)
+
+    def test_freeze_replaces_frozen_package(self):
+        folder = path_join(self.tempFolder, 'frozen')
+        self.make_tube().freeze(folder, package='frozen_again')
+        with open(path_join(folder, 'frozen_again', 'stale.py'), 'wt') as f:
+            f.write('')
+
+        self.make_tube().freeze(folder, package='frozen_again')
+
+        self.assertFalse(exists(path_join(folder, 'frozen_again', 'stale.py')))
+
+    def test_freeze_refuses_to_replace_other_folder(self):
+        folder = path_join(self.tempFolder, 'frozen')
+        makedirs(path_join(folder, 'not_frozen'), exist_ok=True)
+        keep = path_join(folder, 'not_frozen', 'keep.py')
+        with open(keep, 'wt') as f:
+            f.write('')
+
+        with self.assertRaises(BuildError):
+            self.make_tube().freeze(folder, package='not_frozen')
+
+        self.assertTrue(exists(keep))
+
+    def test_frozen_wheel_contents(self):
+        wheel = self.make_tube().freeze_wheel(path_join(self.tempFolder, 'dist'), version='1.2.3')
+
+        with ZipFile(wheel) as f:
+            names = f.namelist()
+
+        self.assertIn('frozen_add/__init__.py', names)
+        self.assertIn('frozen_add/_paste.py', names)
+        self.assertIn('frozen_add-1.2.3.dist-info/RECORD', names)
+        self.assertTrue(any(x.startswith('frozen_add/libfrozen_add') for x in names))
@@ -0,0 +1,60 @@
+from os.path import join as path_join
+from shutil import rmtree
+
+from crelm.headers import HeaderCache, declaration_skeleton
+
+from john import TestCase
+
+
+class DeclarationSkeletonTests(TestCase):
+
+    def test_function_body_is_dropped(self):
+        actual = declaration_skeleton('int f(int a) { return a + 1; }')
+
+        self.assertEqual('int f(int a) {}', actual)
+
+    def test_nested_braces_are_dropped(self):
+        actual = declaration_skeleton('int f() { if (1) { return 2; } return 3; } int g();')
+
+        self.assertEqual('int f() {} int g();', actual)
+
+    def test_struct_body_is_kept(self):
+        actual = declaration_skeleton('struct s { int a; };')
+
+        self.assertEqual('struct s { int a; };', actual)
+
+    def test_braces_in_literals_are_ignored(self):
+        actual = declaration_skeleton('char const *f() { return "}"; } char c = \'{\';')
+
+        self.assertEqual('char const *f() {} char c = \'{\';', actual)
+
+    def test_body_change_keeps_skeleton(self):
+        self.assertEqual(declaration_skeleton('int f() { return 1; }'),
+                         declaration_skeleton('int f() { return 2; }'))
+
+
+class HeaderCacheTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = path_join(self.tempFolder, 'headers')
+        rmtree(root, ignore_errors=True)
+        self.sut = HeaderCache(root)
+
+    def test_lookup_missing_key_is_miss(self):
+        self.assertIsNone(self.sut.lookup('missing'))
+        self.assertEqual(1, self.sut.misses)
+
+    def test_lookup_saved_key_is_hit(self):
+        self.sut.save('key', 'int f();', 'int f();', {})
+
+        actual = self.sut.lookup('key')
+
+        self.assertEqual(('int f();', 'int f();'), actual)
+        self.assertEqual(1, self.sut.hits)
+
+    def test_changed_dependency_is_miss(self):
+        header = self.writeFile('test.h', 'int f();')
+        self.sut.save('key', '', 'int f();', {header: 'stale digest'})
+
+        self.assertIsNone(self.sut.lookup('key'))
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from john import TestCase
 
 # todo foss: this is a bit hacky
@@ -28,3 +30,67 @@ class TestMakeHeaders(TestCase, Factory):
         actual = self.create_LibCrelm().make(
             "int d() { return 1; } int e() { return 1; }")
         assert expected == actual
+
+    def test_make_headers_repeated_name(self):
+        sut = self.create_LibCrelm()
+
+        sut.make("int f(int a) { return a; }")
+        actual = sut.make("int f(char b) { return b; }")
+
+        assert "int f(char b);" == actual
+
+    def test_make_many(self):
+        expected = ["int f();", "void g(int a);", "int h();\nint i();"]
+        actual = self.create_LibCrelm().make_many(
+            ["int f() { return 1; }", "void g(int a) {}", "int h() { return 1; } int i() { return 1; }"])
+        assert expected == actual
+
+    def test_make_many_empty(self):
+        assert [] == self.create_LibCrelm().make_many([])
+
+    def test_make_header_longer_than_source(self):
+        actual = self.create_LibCrelm().make('\n'.join(f'int glob{i};' for i in range(2000)))
+
+        assert 2000 == actual.count('extern int glob')
+
+    def test_make_header_more_than_twice_the_source(self):
+        actual = self.create_LibCrelm().make('int a;int b;int c;')
+
+        assert 'extern int a;\nextern int b;\nextern int c;' == actual
+
+    def test_make_many_headers_longer_than_sources(self):
+        actual = self.create_LibCrelm().make_many(['int aa;'] * 50 + ['int a;int b;int c;'] * 50)
+
+        assert ['extern int aa;'] * 50 == actual[:50]
+        assert ['extern int a;\nextern int b;\nextern int c;'] * 50 == actual[50:]
+
+    def test_make_from_threads(self):
+        sut = self.create_LibCrelm()
+        sources = [f"int f{i}(int a) {{ return a; }}" for i in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            actual = list(executor.map(sut.make, sources))
+
+        assert [f"int f{i}(int a);" for i in range(200)] == actual
+
+    def test_make_reuses_buffers(self):
+        sut = self.create_LibCrelm()
+        sut.make("int j() { return 1; }")
+        expected = [id(x) for x in sut._buffers[sut._lib]]
+
+        sut.make("int k() { return 1; }")
+
+        assert expected == [id(x) for x in sut._buffers[sut._lib]]
+
+    def test_make_grows_buffers_for_large_sources(self):
+        source = "\n".join(f"int big{i}() {{ return {i}; }}" for i in range(500))
+
+        actual = self.create_LibCrelm().make(source)
+
+        assert actual.startswith("int big0();") and actual.endswith("int big499();")
+
+    def test_make_after_large_source(self):
+        sut = self.create_LibCrelm()
+        sut.make("\n".join(f"int big{i}() {{ return {i}; }}" for i in range(500)))
+
+        assert "int l();" == sut.make("int l() { return 1; }")
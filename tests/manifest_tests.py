@@ -0,0 +1,123 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dump as json_dump
+from os import chdir, getcwd
+from os.path import join as path_join, dirname, realpath
+from shutil import rmtree
+
+from crelm import BuildError, Factory
+from crelm.__main__ import main
+from crelm.manifest import tubes_from_manifest
+
+from john import TestCase
+
+EXAMPLES_FOLDER = path_join(dirname(realpath(__file__)), '..', 'examples')
+
+
+class ManifestTests(TestCase, Factory):
+
+    def write_manifest(self, tubes: list, filename: str = 'crelm.json') -> str:
+        fullpath = path_join(self.tempFolder, filename)
+
+        with open(fullpath, 'wt') as f:
+            json_dump({'tubes': tubes}, f)
+
+        return fullpath
+
+    def write_toml_manifest(self) -> str:
+        fullpath = path_join(self.tempFolder, 'crelm.toml')
+
+        with open(fullpath, 'wt') as f:
+            f.write('[[tubes]]\n'
+                    'name = "manifest_toml"\n'
+                    'source_text = "int manifest_toml(void) { return 7; }"\n'
+                    'macros = ["ANSWER=42"]\n')
+
+        return fullpath
+
+    def run_main(self, argv: list):
+        output = StringIO()
+
+        with redirect_stdout(output):
+            code = main(argv)
+
+        return code, output.getvalue()
+
+    def test_json_manifest_creates_tubes(self):
+        manifest = self.write_manifest([
+            {'name': 'manifest_hello', 'source_folder': EXAMPLES_FOLDER,
+             'sources_and_headers': ['hello_world'], 'suppress_warnings': ['unused-function']}])
+
+        actual = tubes_from_manifest(self, manifest)
+
+        self.assertEqual(1, len(actual))
+        self.assertEqual('manifest_hello', actual[0]._name)
+        self.assertEqual(1, len(actual[0]._source_filenames))
+        self.assertIn('-Wno-unused-function', actual[0]._compiler_args)
+
+    def test_toml_manifest_creates_tubes(self):
+        actual = tubes_from_manifest(self, self.write_toml_manifest())
+
+        self.assertEqual(['ANSWER=42'], actual[0]._macros)
+
+    def test_optimize_and_openmp(self):
+        manifest = self.write_manifest([
+            {'name': 'manifest_optimize', 'source_text': 'int manifest_optimize(void) { return 1; }',
+             'optimize': {'level': 'O3', 'fast_math': True}, 'openmp': True}])
+
+        actual = tubes_from_manifest(self, manifest)[0]
+
+        self.assertEqual(['-O3', '-ffast-math'], actual._profile_args())
+        self.assertIn('-fopenmp', actual._link_args)
+
+    def test_invalid_optimize_raises(self):
+        manifest = self.write_manifest([
+            {'name': 'manifest_bad_optimize', 'optimize': {'level': 'O9'}}])
+
+        with self.assertRaises(BuildError):
+            tubes_from_manifest(self, manifest)
+
+    def test_unknown_key_raises(self):
+        manifest = self.write_manifest([{'name': 'manifest_unknown', 'sauces': []}])
+
+        with self.assertRaises(BuildError):
+            tubes_from_manifest(self, manifest)
+
+    def test_build_prints_timing_table(self):
+        artifacts = path_join(self.tempFolder, 'artifacts')
+        rmtree(artifacts, ignore_errors=True)
+        manifest = self.write_manifest([
+            {'name': 'manifest_add', 'source_text': 'int manifest_add(int a, int b) { return a + b; }'}])
+
+        code, output = self.run_main(['build', manifest, '--artifacts', artifacts])
+
+        self.assertEqual(0, code)
+        self.assertIn('compile', output.splitlines()[0])
+        self.assertRegex(output, r'manifest_add +built')
+
+        code, output = self.run_main(['build', manifest, '--artifacts', artifacts])
+
+        self.assertEqual(0, code)
+        self.assertRegex(output, r'manifest_add +cached')
+
+    def test_build_with_relative_artifacts_folder(self):
+        self.addCleanup(chdir, getcwd())
+        chdir(self.tempFolder)
+        rmtree('relative_artifacts', ignore_errors=True)
+        manifest = self.write_manifest([
+            {'name': 'manifest_relative', 'source_text': 'int manifest_relative(void) { return 1; }'}])
+
+        code, output = self.run_main(['build', manifest, '--artifacts', 'relative_artifacts'])
+
+        self.assertEqual(0, code, output)
+        self.assertRegex(output, r'manifest_relative +built')
+
+    def test_build_failure_exits_nonzero(self):
+        manifest = self.write_manifest([
+            {'name': 'manifest_broken', 'source_text': 'int manifest_broken(void) { return }'}])
+
+        code, output = self.run_main(['build', manifest, '--artifacts',
+                                      path_join(self.tempFolder, 'artifacts')])
+
+        self.assertEqual(1, code)
+        self.assertIn('error: manifest_broken', output)
@@ -0,0 +1,133 @@
+from glob import glob
+from os import environ, remove
+from os.path import join as path_join, exists
+from shutil import rmtree
+from unittest.mock import patch
+
+from crelm.objects import ObjectCache, parse_depfile
+from crelm.report import BuildReport
+
+from john import TestCase
+
+
+class ParseDepfileTests(TestCase):
+
+    def test_single_line(self):
+        actual = parse_depfile('a.o: a.c a.h\n')
+
+        self.assertEqual(['a.c', 'a.h'], actual)
+
+    def test_continuation_lines(self):
+        actual = parse_depfile('a.o: a.c \\\n b.h \\\n c.h\n')
+
+        self.assertEqual(['a.c', 'b.h', 'c.h'], actual)
+
+
+class ObjectCacheTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = path_join(self.tempFolder, 'objects')
+        rmtree(root, ignore_errors=True)
+        self.sut = ObjectCache(root)
+
+    def write_sources(self, value: int = 1):
+        self.writeFile('unit.h', f'#define VALUE {value}\nint unit();')
+        return self.writeFile('unit.c', '#include "unit.h"\nint unit() { return VALUE; }')
+
+    def test_compile_creates_object(self):
+        actual = self.sut.compile(self.write_sources(), [], [])
+
+        self.assertTrue(exists(actual))
+        self.assertEqual(1, self.sut.misses)
+
+    def test_compile_unchanged_source_is_hit(self):
+        source = self.write_sources()
+
+        expected = self.sut.compile(source, [], [])
+        actual = self.sut.compile(source, [], [])
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(1, self.sut.hits)
+
+    def test_compile_changed_header_is_miss(self):
+        self.sut.compile(self.write_sources(1), [], [])
+        self.sut.compile(self.write_sources(2), [], [])
+
+        self.assertEqual(2, self.sut.misses)
+
+    def test_compile_changed_flags_is_miss(self):
+        source = self.write_sources()
+
+        self.sut.compile(source, [], [])
+        self.sut.compile(source, ['-O0'], [])
+
+        self.assertEqual(2, self.sut.misses)
+
+    def test_compile_unused_macro_is_preprocessed_hit(self):
+        source = self.write_sources()
+
+        self.sut.compile(source, [], [])
+        self.sut.compile(source, ['-DOTHER'], [])
+
+        self.assertEqual(1, self.sut.preprocessed_hits)
+
+    def test_compile_same_unit_elsewhere_is_preprocessed_hit(self):
+        expected = self.sut.compile(self.writeFile('one.c', 'int one() { return 1; }'), [], [])
+        actual = self.sut.compile(self.writeFile('two.c', 'int one() { return 1; }'), [], [])
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(1, self.sut.stats()['preprocessed_hits'])
+        self.assertEqual(1, self.sut.stats()['misses'])
+
+    def test_compile_counts_in_report(self):
+        report = BuildReport('objects')
+        source = self.write_sources()
+
+        self.sut.compile(source, [], [], report)
+        self.sut.compile(source, [], [], report)
+
+        self.assertEqual({'hits': 1, 'misses': 1}, report.caches['objects'])
+        self.assertEqual({'hits': 0, 'misses': 1}, report.caches['preprocessed'])
+
+    def test_cache_dir_from_environment(self):
+        root = path_join(self.tempFolder, 'shared')
+
+        with patch.dict(environ, {'CRELM_CACHE_DIR': root}):
+            actual = ObjectCache()
+
+        self.assertEqual(root, actual.root)
+
+    def test_compile_reverted_header_is_hit(self):
+        self.sut.compile(self.write_sources(1), [], [])
+        self.sut.compile(self.write_sources(2), [], [])
+        self.sut.compile(self.write_sources(1), [], [])
+
+        self.assertEqual(1, self.sut.hits)
+
+    def test_compile_error_returns_None(self):
+        source = self.writeFile('bad.c', 'this wont compile')
+
+        self.assertIsNone(self.sut.compile(source, [], []))
+
+    def test_manifest_entry_without_object_file_is_miss(self):
+        source = self.write_sources()
+        remove(self.sut.compile(source, [], []))
+
+        actual = [self.sut.compile(source, [], []), self.sut.compile(source, ['-DOTHER'], [])]
+
+        self.assertTrue(all(exists(x) for x in actual))
+
+    def test_compile_without_direct_writes_no_manifest(self):
+        for i in range(3):
+            self.sut.compile(self.writeFile(f'scratch{i}.c', 'int scratch() { return 1; }'), [], [], direct=False)
+
+        self.assertEqual([], glob(path_join(self.sut.store.root, '.manifests', '*.json')))
+        self.assertEqual(2, self.sut.preprocessed_hits)
+
+    def test_manifests_are_pruned_with_objects(self):
+        self.sut.compile(self.write_sources(), [], [])
+
+        self.sut.store.clear()
+
+        self.assertEqual([], glob(path_join(self.sut.store.root, '.manifests', '*.json')))
@@ -0,0 +1,295 @@
+from array import array
+from mmap import mmap
+from unittest import skipIf
+
+from crelm import Factory
+
+from john import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HEADER = '''
+struct buffer_point_t { int x; double y; };
+double buffer_sum(double const *values, int n);
+void buffer_fill(int *values, int n);
+int *buffer_ints(void);
+struct buffer_point_t *buffer_points(void);
+'''
+
+SOURCE = '''
+#include <stddef.h>
+struct buffer_point_t { int x; double y; };
+static int ints[4] = { 1, 2, 3, 4 };
+static struct buffer_point_t points[2] = { { 1, 1.5 }, { 2, 2.5 } };
+double buffer_sum(double const *values, int n) { double s = 0; for (int i = 0; i < n; ++i) s += values[i]; return s; }
+void buffer_fill(int *values, int n) { for (int i = 0; i < n; ++i) values[i] = i * i; }
+int *buffer_ints(void) { return ints; }
+struct buffer_point_t *buffer_points(void) { return points; }
+'''
+
+
+class BufferTests(TestCase, Factory):
+
+    def setUp(self):
+        super().setUp()
+        self.paste = self.create_Tube('buffer') \
+            .add_header_text(HEADER) \
+            .add_source_text(SOURCE) \
+            .squeeze()
+
+    def test_from_buffer_passes_array_without_copy(self):
+        values = array('d', [1, 2, 3])
+
+        actual = self.paste.buffer_sum(self.paste.from_buffer('double', values), 3)
+
+        self.assertEqual(6, actual)
+
+    def test_from_buffer_writes_through(self):
+        values = array('i', [0] * 4)
+
+        self.paste.buffer_fill(self.paste.from_buffer('int', values, writable=True), 4)
+
+        self.assertEqual(array('i', [0, 1, 4, 9]), values)
+
+    def test_from_buffer_accepts_raw_bytes(self):
+        values = bytearray(4 * 4)
+
+        self.paste.buffer_fill(self.paste.from_buffer('int', values, writable=True), 4)
+
+        self.assertEqual([0, 1, 4, 9], list(memoryview(values).cast('i')))
+
+    def test_from_buffer_accepts_mmap(self):
+        values = mmap(-1, 4 * 4)
+
+        self.paste.buffer_fill(self.paste.from_buffer('int', values, writable=True), 4)
+
+        self.assertEqual(9, memoryview(values).cast('i')[3])
+
+    def test_from_buffer_rejects_wrong_type(self):
+        with self.assertRaises(TypeError):
+            self.paste.from_buffer('double', array('q', [1, 2]))
+
+    def test_from_buffer_rejects_partial_items(self):
+        with self.assertRaises(ValueError):
+            self.paste.from_buffer('int', bytearray(6))
+
+    def test_from_buffer_rejects_readonly_when_writable(self):
+        with self.assertRaises(BufferError):
+            self.paste.from_buffer('int', bytes(16), writable=True)
+
+    def test_as_memoryview_wraps_c_memory(self):
+        actual = self.paste.as_memoryview(self.paste.buffer_ints(), 4)
+
+        self.assertEqual([1, 2, 3, 4], actual.tolist())
+
+    def test_as_memoryview_shape(self):
+        actual = self.paste.as_memoryview(self.paste.buffer_ints(), shape=(2, 2))
+
+        self.assertEqual([[1, 2], [3, 4]], actual.tolist())
+
+    def test_as_memoryview_pointer_needs_length(self):
+        with self.assertRaises(ValueError):
+            self.paste.as_memoryview(self.paste.buffer_ints())
+
+    def test_as_memoryview_of_cffi_array_uses_its_length(self):
+        values = self.paste.new_char_array(3)
+
+        self.assertEqual(3, len(self.paste.as_memoryview(values)))
+
+    @skipIf(numpy is None, 'numpy not installed')
+    def test_as_array_shares_c_memory(self):
+        ints = self.paste.buffer_ints()
+
+        actual = self.paste.as_array(ints, 4)
+        actual[0] = 10
+
+        self.assertEqual(numpy.dtype('i'), actual.dtype)
+        self.assertEqual(10, ints[0])
+        ints[0] = 1
+
+    @skipIf(numpy is None, 'numpy not installed')
+    def test_as_array_checks_dtype(self):
+        with self.assertRaises(TypeError):
+            self.paste.as_array(self.paste.buffer_ints(), 4, dtype='float64')
+
+    @skipIf(numpy is None, 'numpy not installed')
+    def test_as_array_of_structs(self):
+        actual = self.paste.as_array(self.paste.buffer_points(), 2)
+
+        self.assertEqual([1, 2], actual['x'].tolist())
+        self.assertEqual([1.5, 2.5], actual['y'].tolist())
+
+    @skipIf(numpy is None, 'numpy not installed')
+    def test_from_buffer_numpy(self):
+        values = numpy.arange(4.0)
+
+        actual = self.paste.buffer_sum(self.paste.from_buffer('double', values), 4)
+
+        self.assertEqual(6, actual)
+
+
+class ArenaTests(TestCase, Factory):
+
+    def setUp(self):
+        super().setUp()
+        self.paste = self.create_Tube('arena') \
+            .add_header_text('struct arena_point_t { int x; double y; };\n'
+                             'double arena_sum(struct arena_point_t const *points, int n);') \
+            .add_source_text('struct arena_point_t { int x; double y; };\n'
+                             'double arena_sum(struct arena_point_t const *points, int n) '
+                             '{ double s = 0; for (int i = 0; i < n; ++i) s += points[i].x + points[i].y; return s; }') \
+            .squeeze()
+
+    def test_new_array_from_length(self):
+        actual = self.paste.new_array('int', 3)
+
+        self.assertEqual([0, 0, 0], list(actual))
+
+    def test_new_array_from_values(self):
+        actual = self.paste.new_array('double', [1, 2])
+
+        self.assertEqual([1, 2], list(actual))
+
+    def test_arena_allocates_zeroed_structs(self):
+        arena = self.paste.arena()
+
+        point = arena.new('struct arena_point_t')
+
+        self.assertEqual(0, point.x)
+        self.assertEqual(0, point.y)
+
+    def test_arena_array_passes_to_c(self):
+        arena = self.paste.arena()
+        points = arena.new_array('struct arena_point_t', 2)
+        points[0].x, points[0].y = 1, 0.5
+        points[1].x, points[1].y = 2, 0.5
+
+        actual = self.paste.arena_sum(points, 2)
+
+        self.assertEqual(4, actual)
+
+    def test_arena_aligns_allocations(self):
+        arena = self.paste.arena()
+        arena.new('char')
+
+        actual = arena.new('double')
+
+        self.assertEqual(0, int(self.paste._ffi.cast('uintptr_t', actual)) % 8)
+
+    def test_arena_char_array(self):
+        arena = self.paste.arena()
+
+        actual = arena.new_char_array('crelm')
+
+        self.assertEqual('crelm', self.paste.str(actual))
+
+    def test_arena_stats(self):
+        arena = self.paste.arena(block_size=1024)
+        arena.new('int', 10)
+
+        actual = arena.stats
+
+        self.assertEqual({'blocks': 1, 'bytes_allocated': 1024,
+                          'bytes_live': 40, 'allocations': 1}, actual)
+
+    def test_arena_grows_by_blocks(self):
+        arena = self.paste.arena(block_size=64)
+
+        for _ in range(10):
+            arena.new('double', 4)
+
+        self.assertEqual(5, arena.stats['blocks'])
+
+    def test_arena_large_allocation_gets_own_block(self):
+        arena = self.paste.arena(block_size=64)
+
+        arena.new('char', 1000)
+
+        self.assertEqual(1000, arena.stats['bytes_allocated'])
+
+    def test_reset_reuses_blocks_and_zeroes(self):
+        arena = self.paste.arena(block_size=64)
+        arena.new('int')[0] = 5
+
+        arena.reset()
+        actual = arena.new('int')
+
+        self.assertEqual(0, actual[0])
+        self.assertEqual(1, arena.stats['blocks'])
+        self.assertEqual(4, arena.stats['bytes_live'])
+
+    def test_context_manager_resets(self):
+        with self.paste.arena() as arena:
+            arena.new('int', 4)
+
+        self.assertEqual(0, arena.stats['bytes_live'])
+
+    def test_release_frees_blocks(self):
+        arena = self.paste.arena()
+        arena.new('int')
+
+        arena.release()
+
+        self.assertEqual(0, arena.stats['bytes_allocated'])
+
+
+class ParallelMapTests(TestCase, Factory):
+
+    def setUp(self):
+        super().setUp()
+        self.paste = self.create_Tube('parallel') \
+            .add_source_text('double parallel_sum(double const *values, int n) '
+                             '{ double s = 0; for (int i = 0; i < n; ++i) s += values[i]; return s; }\n'
+                             'void parallel_square(double *values, int n) '
+                             '{ for (int i = 0; i < n; ++i) values[i] *= values[i]; }') \
+            .squeeze()
+
+    def test_split_buffer_covers_every_item(self):
+        actual = self.paste.split_buffer('double', array('d', range(10)), 3)
+
+        self.assertEqual([4, 3, 3], [count for _, count in actual])
+
+    def test_split_buffer_skips_empty_parts(self):
+        actual = self.paste.split_buffer('double', array('d', range(2)), 4)
+
+        self.assertEqual(2, len(actual))
+
+    def test_parallel_map_keeps_order(self):
+        values = array('d', range(1000))
+        chunks = self.paste.split_buffer('double', values, 4)
+
+        actual = self.paste.parallel_map('parallel_sum', chunks, threads=4)
+
+        self.assertEqual([sum(range(i * 250, (i + 1) * 250)) for i in range(4)], actual)
+
+    def test_parallel_map_writes_through(self):
+        values = array('d', range(8))
+
+        self.paste.parallel_map(self.paste.parallel_square, self.paste.split_buffer(
+            'double', values, 4, writable=True), threads=2)
+
+        self.assertEqual(array('d', [x * x for x in range(8)]), values)
+
+
+class CollisionTests(TestCase, Factory):
+
+    def setUp(self):
+        super().setUp()
+        self.paste = self.create_Tube('collision') \
+            .add_source_text('int buffer(int x) { return 2 * x; }\n'
+                             'int arena(void) { return 7; }\n'
+                             'int collision(void) { return 1; }') \
+            .squeeze()
+
+    def test_c_functions_win_over_helpers(self):
+        actual = (self.paste.buffer(21), self.paste.arena(), self.paste.collision())
+
+        self.assertEqual((42, 7, 1), actual)
+
+    def test_helpers_without_collision_still_work(self):
+        actual = self.paste.new_array('int', [1, 2])
+
+        self.assertEqual([1, 2], list(actual))
@@ -0,0 +1,34 @@
+from crelm.preprocessor import Preprocessor, strip_lines
+
+from john import TestCase
+
+
+class StripLinesTests(TestCase):
+
+    def test_strips_prefixed_and_blank_lines(self):
+        actual = list(strip_lines(['# 1 "x.c"', '', '  int a;  ', '#pragma'], '#'))
+
+        self.assertEqual(['int a;'], actual)
+
+
+class PreprocessorTests(TestCase):
+
+    def test_run_expands_macros(self):
+        source = self.writeFile('test.c', 'int NAME();')
+
+        actual = Preprocessor(['NAME=expanded']).run(source)
+
+        self.assertEqual('int expanded();', actual)
+
+    def test_run_uses_include_dirs(self):
+        self.writeFile('included.h', 'int included();')
+        source = self.writeFile('test.c', '#include "included.h"\nint a();')
+
+        actual = Preprocessor([], [self.tempFolder]).run(source)
+
+        self.assertEqual('int included();\nint a();', actual)
+
+    def test_run_error_returns_None(self):
+        source = self.writeFile('test.c', '#include "missing.h"')
+
+        self.assertIsNone(Preprocessor([]).run(source))
@@ -0,0 +1,103 @@
+from pickle import dumps, loads
+from time import sleep
+
+from crelm import BuildHook, BuildReport, add_build_hook, remove_build_hook
+
+from john import TestCase
+
+
+class RecordingHook(BuildHook):
+    def __init__(self):
+        self.events = []
+
+    def phase_started(self, report, phase):
+        self.events.append(('started', phase))
+
+    def phase_finished(self, report, phase, wall, cpu):
+        self.events.append(('finished', phase))
+
+    def command_run(self, report, command):
+        self.events.append(('command', command[0]))
+
+    def build_finished(self, report):
+        self.events.append(('build', report.name))
+
+
+class BuildReportTests(TestCase):
+
+    def test_phase_records_wall_and_cpu(self):
+        sut = BuildReport('test')
+
+        with sut.phase('compile'):
+            sleep(0.01)
+
+        self.assertGreaterEqual(sut.phases['compile']['wall'], 0.01)
+        self.assertIn('cpu', sut.phases['compile'])
+
+    def test_repeated_phase_accumulates(self):
+        sut = BuildReport('test')
+
+        with sut.phase('compile'):
+            sleep(0.01)
+        with sut.phase('compile'):
+            sleep(0.01)
+
+        self.assertGreaterEqual(sut.timings['compile'], 0.02)
+
+    def test_count_cache_hits_and_misses(self):
+        sut = BuildReport('test')
+
+        sut.count('objects', True)
+        sut.count('objects', False)
+        sut.count('objects', False)
+
+        self.assertEqual({'hits': 1, 'misses': 2}, sut.caches['objects'])
+
+    def test_hooks_receive_events(self):
+        hook = RecordingHook()
+        sut = BuildReport('test', [hook])
+
+        with sut.phase('compile'):
+            sut.add_command(['gcc', '-c'])
+        sut.finish()
+
+        self.assertEqual([('started', 'compile'), ('command', 'gcc'),
+                          ('finished', 'compile'), ('build', 'test')], hook.events)
+
+    def test_global_hook_receives_events(self):
+        hook = RecordingHook()
+        add_build_hook(hook)
+
+        try:
+            BuildReport('test_global').finish()
+        finally:
+            remove_build_hook(hook)
+
+        self.assertEqual([('build', 'test_global')], hook.events)
+
+    def test_finish_records_error(self):
+        sut = BuildReport('test').finish(ValueError('broken'))
+
+        self.assertEqual('broken', sut.error)
+
+    def test_pickle_drops_hooks(self):
+        sut = BuildReport('test', [RecordingHook()])
+        with sut.phase('compile'):
+            pass
+
+        actual = loads(dumps(sut))
+
+        self.assertEqual(['compile'], list(actual.timings))
+        self.assertEqual([], actual._hooks)
+
+    def test_merge_adds_phases_and_commands(self):
+        other = BuildReport('test')
+        with other.phase('compile'):
+            other.add_command(['gcc'])
+        other.cache_hit = False
+
+        sut = BuildReport('test').merge(other)
+
+        self.assertEqual(['compile'], list(sut.timings))
+        self.assertEqual([['gcc']], sut.commands)
+        self.assertFalse(sut.cache_hit)
@@ -0,0 +1,224 @@
+from contextlib import redirect_stdout
+from glob import glob
+from io import StringIO
+from os import makedirs, remove, utime
+from os.path import basename, join as path_join, exists
+from subprocess import run
+from sys import executable
+from threading import Event, Thread
+from time import sleep
+
+from crelm.__main__ import main
+from crelm.store import ArtifactStore
+
+from john import TestCase
+
+
+class ArtifactStoreTests(TestCase):
+
+    LOCK_SCRIPT = '\n'.join([
+        'from fcntl import flock, LOCK_EX, LOCK_NB',
+        'from sys import argv, exit',
+        'f = open(argv[1], "a")',
+        'try:',
+        '    flock(f.fileno(), LOCK_EX | LOCK_NB)',
+        'except OSError:',
+        '    exit(1)'])
+
+    def setUp(self):
+        super().setUp()
+        self.sut = ArtifactStore(path_join(self.tempFolder, 'artifacts'),
+                                 max_bytes=1000, max_age=3600)
+        self.sut.clear()
+
+    def add_artifact(self, key: str, name: str = 'test', size: int = 100):
+        folder = self.sut.path(key)
+        makedirs(folder, exist_ok=True)
+
+        with open(path_join(folder, 'artifact'), 'wb') as f:
+            f.write(b'x' * size)
+
+        return self.sut.publish(key, name)
+
+    def test_publish_records_size(self):
+        actual = self.add_artifact('a', size=123)
+
+        self.assertEqual(123, actual['bytes'])
+
+    def test_lookup_missing_key_returns_None(self):
+        self.assertIsNone(self.sut.lookup('missing'))
+
+    def test_lookup_published_key(self):
+        self.add_artifact('a', name='test_lookup')
+
+        actual = self.sut.lookup('a')
+
+        self.assertEqual('test_lookup', actual['name'])
+
+    def test_latest_returns_most_recently_used_key(self):
+        self.add_artifact('a')
+        self.add_artifact('b')
+        self.sut.lookup('a')
+
+        self.assertEqual('a', self.sut.latest('test'))
+
+    def test_size_cap_evicts_least_recently_used(self):
+        [self.add_artifact(key, size=400) for key in ('a', 'b')]
+        self.sut.lookup('a')
+
+        self.add_artifact('c', size=400)
+
+        self.assertIsNotNone(self.sut.lookup('a'))
+        self.assertIsNone(self.sut.lookup('b'))
+        self.assertFalse(exists(self.sut.path('b')))
+
+    def test_publish_keeps_entry_over_size_cap(self):
+        self.add_artifact('a', size=400)
+
+        self.add_artifact('b', size=2000)
+
+        self.assertIsNone(self.sut.lookup('a'))
+        self.assertIsNotNone(self.sut.lookup('b'))
+
+    def test_age_cap_evicts_old_artifacts(self):
+        self.add_artifact('a')
+
+        actual = self.sut.prune(max_age=-1)
+
+        self.assertEqual(['a'], actual)
+
+    def test_stats(self):
+        self.add_artifact('a', name='x', size=10)
+        self.add_artifact('b', name='y', size=20)
+
+        actual = self.sut.stats()
+
+        self.assertEqual(2, actual['entries'])
+        self.assertEqual(30, actual['bytes'])
+        self.assertEqual(['x', 'y'], actual['names'])
+
+    def test_publish_scratch_moves_into_place(self):
+        scratch = self.sut.scratch('a')
+        self.writeFile(path_join(scratch, 'artifact'), 'built')
+
+        actual = self.sut.publish('a', 'test', scratch)
+
+        self.assertEqual(5, actual['bytes'])
+        self.assertFalse(exists(scratch))
+        self.assertTrue(exists(path_join(self.sut.path('a'), 'artifact')))
+
+    def test_publish_scratch_replaces_stale_folder(self):
+        self.add_artifact('a')
+        scratch = self.sut.scratch('a')
+        self.writeFile(path_join(scratch, 'rebuilt'), 'x')
+
+        self.sut.publish('a', 'test', scratch)
+
+        self.assertFalse(exists(path_join(self.sut.path('a'), 'artifact')))
+        self.assertEqual([], glob(path_join(self.sut.root, '*.tmp')))
+
+    def test_prune_removes_abandoned_scratch(self):
+        scratch = self.sut.scratch('a')
+        utime(scratch, (0, 0))
+
+        self.sut.prune()
+
+        self.assertFalse(exists(scratch))
+
+    def test_lock_excludes_other_processes(self):
+        lock_filename = path_join(self.sut.root, '.locks', 'a.lock')
+
+        with self.sut.lock('a'):
+            locked = run([executable, '-c', self.LOCK_SCRIPT, lock_filename]).returncode
+
+        unlocked = run([executable, '-c', self.LOCK_SCRIPT, lock_filename]).returncode
+
+        self.assertEqual(1, locked)
+        self.assertEqual(0, unlocked)
+
+    def test_prune_removes_idle_lock_files(self):
+        with self.sut.lock('a'):
+            pass
+
+        with self.sut.lock('b'):
+            self.sut.prune()
+
+            actual = sorted(basename(x) for x in glob(path_join(self.sut.root, '.locks', '*.lock')))
+
+        self.assertEqual(['b.lock', 'index.lock'], actual)
+
+    def test_lock_removed_while_waiting_locks_new_file(self):
+        lock_filename = path_join(self.sut.root, '.locks', 'a.lock')
+        locked = Event()
+        done = Event()
+
+        def wait_for_lock():
+            with self.sut.lock('a'):
+                locked.set()
+                done.wait(60)
+
+        with self.sut.lock('a'):
+            thread = Thread(target=wait_for_lock)
+            thread.start()
+            sleep(0.1)
+            remove(lock_filename)
+
+        locked.wait(60)
+        held = run([executable, '-c', self.LOCK_SCRIPT, lock_filename]).returncode
+        done.set()
+        thread.join()
+
+        self.assertEqual(1, held)
+
+    def test_manifest_lists_published_artifacts(self):
+        self.add_artifact('a')
+        self.sut.add_manifest_entry('build', 'a', {'x.h': '1'})
+
+        actual = self.sut.load_manifest('build')
+
+        self.assertEqual([{'key': 'a', 'deps': {'x.h': '1'}}], actual)
+
+    def test_prune_drops_manifest_entries_of_evicted_artifacts(self):
+        self.add_artifact('a')
+        self.sut.add_manifest_entry('build', 'a', {})
+
+        self.sut.clear()
+
+        self.assertEqual([], self.sut.load_manifest('build'))
+        self.assertEqual([], glob(path_join(self.sut.root, '.manifests', '*.json')))
+
+
+class CacheCommandTests(TestCase):
+
+    def run_main(self, argv: list):
+        output = StringIO()
+
+        with redirect_stdout(output):
+            code = main(argv)
+
+        return code, output.getvalue()
+
+    def test_stats_covers_every_store(self):
+        code, output = self.run_main(['cache', 'stats'])
+
+        self.assertEqual(0, code)
+        for name in ('artifacts', 'objects', 'headers', 'cdefs'):
+            self.assertIn(f'[{name}]', output)
+
+    def test_stats_of_one_store(self):
+        code, output = self.run_main(['cache', '--store', 'headers', 'stats'])
+
+        self.assertIn('[headers]', output)
+        self.assertNotIn('[objects]', output)
+
+    def test_prune_all_of_root(self):
+        store = ArtifactStore(path_join(self.tempFolder, 'cli'))
+        makedirs(store.path('a'), exist_ok=True)
+        with open(path_join(store.path('a'), 'artifact'), 'wb') as f:
+            f.write(b'x' * 100)
+        store.publish('a', 'test')
+
+        code, output = self.run_main(['cache', '--root', store.root, 'prune', '--all'])
+
+        self.assertEqual('artifacts: removed 1 entries\n', output)
+        self.assertIsNone(store.lookup('a'))
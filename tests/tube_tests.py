@@ -1,5 +1,31 @@
+from asyncio import CancelledError, ensure_future, run, sleep as async_sleep, wait_for, TimeoutError
+from glob import glob
+from os import environ, utime
+from os.path import dirname, exists, join as path_join, realpath
+from shutil import rmtree
+from subprocess import Popen, PIPE
+from sys import executable, modules, path
+from time import monotonic, sleep, time_ns
+from unittest import skipIf
+from unittest.mock import patch
+
 from john import TestCase
-from crelm import Factory
+from crelm import Factory, ArtifactStore
+from crelm.cache import openmp_supported
+from crelm.headers import HeaderCache
+from crelm.objects import ObjectCache
+
+
+class StoreTestCase(TestCase, Factory):
+    # foss: each test builds into its own empty artifact store
+
+    def setUp(self):
+        super().setUp()
+        self.store = ArtifactStore(path_join(self.tempFolder, 'artifacts'))
+        self.store.clear()
+
+    def create_stored_Tube(self, name: str):
+        return self.create_Tube(name).set_artifact_store(self.store)
 
 
 class TestSqueeze(TestCase, Factory):
@@ -158,6 +184,21 @@ class TestPasteWithFiles(TestCase, Factory):
         self.assertEqual(1, actual1)
         self.assertEqual(2, actual2)
 
+    def test_source_files_compiled_in_parallel(self):
+        headers = [self.writeFile(f'test{i}.h', f'int test{i}_file();') for i in range(4)]
+        sources = [self.writeFile(f'test{i}.c', f'int test{i}_file() {{ return {i}; }}')
+                   for i in range(4)]
+
+        sut = self.create_Tube(self.testName) \
+            .jobs(4) \
+            .add_header_files(headers) \
+            .add_source_files(sources) \
+            .squeeze()
+
+        actual = [sut.test0_file(), sut.test1_file(), sut.test2_file(), sut.test3_file()]
+
+        self.assertEqual([0, 1, 2, 3], actual)
+
     def test_source_and_header_file(self):
         expected = 7
 
@@ -203,6 +244,35 @@ class TestPasteWithFiles(TestCase, Factory):
         self.assertEqual(expected2, actual2)
 
 
+class TestIncrementalBuild(StoreTestCase):
+
+    def test_changed_source_file_recompiles_only_that_file(self):
+        rmtree(path_join(self.tempFolder, 'objects'), ignore_errors=True)
+        cache = ObjectCache(path_join(self.tempFolder, 'objects'))
+
+        header1 = self.writeFile('test1.h', 'int test1_file();')
+        header2 = self.writeFile('test2.h', 'int test2_file();')
+        source1 = self.writeFile('test1.c', 'int test1_file() { return 1; }')
+        source2 = self.writeFile('test2.c', 'int test2_file() { return 2; }')
+
+        self.create_stored_Tube(self.testName) \
+            .set_object_cache(cache) \
+            .add_header_files([header1, header2]) \
+            .add_source_files([source1, source2]) \
+            .squeeze()
+
+        self.writeFile('test2.c', 'int test2_file() { return 3; }')
+        misses = cache.misses
+
+        self.create_stored_Tube(self.testName) \
+            .set_object_cache(cache) \
+            .add_header_files([header1, header2]) \
+            .add_source_files([source1, source2]) \
+            .squeeze()
+
+        self.assertEqual(misses + 1, cache.misses)
+
+
 class TestMacros(TestCase, Factory):
 
     def test_source_text_with_source_macro(self):
@@ -353,3 +423,566 @@ class TestPasteMetadata(TestCase, Factory):
             .function_decl('func_t', 'test_func')
 
         self.assertEqual('int test_func(int)', actual)
+
+
+class TestBuildCache(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.headers = HeaderCache(path_join(self.tempFolder, 'headers'))
+        self.headers.store.clear()
+
+    def make_tube(self, macro: str, name: str = None, value: int = 5):
+        return self.create_stored_Tube(name if name else self.testName) \
+            .set_header_cache(self.headers) \
+            .add_source_text(f'int NAME() {{ return {value}; }}') \
+            .add_macro(macro)
+
+    def test_concurrent_processes_build_once(self):
+        script = '\n'.join([
+            'from sys import argv',
+            'from crelm import Factory, ArtifactStore',
+            'tube = Factory().create_Tube("concurrent_build") \\',
+            '    .set_artifact_store(ArtifactStore(argv[1])) \\',
+            '    .add_source_text("int concurrent_build(void) { return 7; }")',
+            'print(tube.squeeze().concurrent_build(), tube.cache_hit)'])
+        root = dirname(dirname(realpath(__file__)))
+
+        processes = [Popen([executable, '-c', script, self.store.root], stdout=PIPE, stderr=PIPE,
+                           env=dict(environ, PYTHONPATH=root))
+                     for _ in range(3)]
+        actual = sorted(x.communicate()[0].decode().split('\n')[-2] for x in processes)
+
+        self.assertEqual(['7 False', '7 True', '7 True'], actual)
+        self.assertEqual(1, self.store.stats()['entries'])
+        self.assertEqual([], glob(path_join(self.store.root, '*.tmp')))
+
+    def test_changed_nested_header_is_cache_miss(self):
+        def make_tube():
+            return self.create_stored_Tube('nested_header') \
+                .set_header_cache(self.headers) \
+                .add_header_file(self.writeFile('nested.h', 'int nested(void);')) \
+                .add_source_file(self.writeFile('nested.c', '#include "inner.h"\nint nested(void) { return VALUE; }'))
+
+        self.writeFile('inner.h', '#define VALUE 1')
+        expected = make_tube().squeeze().nested()
+
+        self.writeFile('inner.h', '#define VALUE 2')
+        tube = make_tube()
+        actual = tube.squeeze().nested()
+
+        self.assertEqual((1, 2), (expected, actual))
+        self.assertFalse(tube.cache_hit)
+
+    def test_reverted_nested_header_is_cache_hit(self):
+        def make_tube():
+            return self.create_stored_Tube('nested_revert') \
+                .add_header_file(self.writeFile('revert.h', 'int nested_revert(void);')) \
+                .add_source_file(self.writeFile('revert.c', '#include "inner_revert.h"\nint nested_revert(void) { return VALUE; }'))
+
+        for value in (1, 2, 1):
+            self.writeFile('inner_revert.h', f'#define VALUE {value}')
+            tube = make_tube()
+            actual = tube.squeeze().nested_revert()
+
+        self.assertEqual(1, actual)
+        self.assertTrue(tube.cache_hit)
+
+    def test_first_squeeze_is_cache_miss(self):
+        tube = self.make_tube('NAME=test_first')
+        tube.squeeze()
+
+        self.assertFalse(tube.cache_hit)
+
+    def test_unchanged_tube_is_cache_hit(self):
+        self.make_tube('NAME=test_cached').squeeze()
+
+        tube = self.make_tube('NAME=test_cached')
+        actual = tube.squeeze().test_cached()
+
+        self.assertTrue(tube.cache_hit)
+        self.assertEqual(5, actual)
+
+    def test_changed_tube_is_cache_miss(self):
+        self.make_tube('NAME=test_first').squeeze()
+
+        tube = self.make_tube('NAME=test_second')
+        tube.squeeze()
+
+        self.assertFalse(tube.cache_hit)
+
+    def test_same_name_tubes_do_not_overwrite(self):
+        self.make_tube('NAME=test_first').squeeze()
+        self.make_tube('NAME=test_second').squeeze()
+
+        tube = self.make_tube('NAME=test_first')
+        tube.squeeze()
+
+        self.assertTrue(tube.cache_hit)
+
+    def test_timings_cover_build_phases(self):
+        tube = self.make_tube('NAME=test_timings')
+        tube.squeeze()
+
+        self.assertEqual(['cdef', 'compile', 'compile_objects', 'load', 'makeheaders',
+                          'preprocess_headers', 'preprocess_source'], sorted(tube.timings))
+
+    def test_report_records_commands_caches_and_artifacts(self):
+        tube = self.make_tube('NAME=test_report')
+        tube.squeeze()
+
+        actual = tube.report
+
+        self.assertFalse(actual.cache_hit)
+        self.assertIsNone(actual.error)
+        self.assertTrue(actual.commands)
+        self.assertTrue(all('gcc' == x[0] for x in actual.commands))
+        self.assertEqual({'hits': 0, 'misses': 1}, actual.caches['headers'])
+        self.assertIn('crelm_cdef.h', actual.artifacts)
+        self.assertTrue(any(x.startswith(tube._module_name) for x in actual.artifacts))
+
+    def test_report_hook_sees_squeeze(self):
+        from crelm import BuildHook
+
+        class Hook(BuildHook):
+            def __init__(self):
+                self.phases = []
+                self.reports = []
+
+            def phase_finished(self, report, phase, wall, cpu):
+                self.phases.append(phase)
+
+            def build_finished(self, report):
+                self.reports.append(report)
+
+        hook = Hook()
+        tube = self.make_tube('NAME=test_hook').add_hook(hook)
+        tube.squeeze()
+
+        self.assertIn('compile', hook.phases)
+        self.assertEqual('load', hook.phases[-1])
+        self.assertEqual([tube.report], hook.reports)
+
+    def test_function_body_change_skips_makeheaders(self):
+        self.make_tube('NAME=test_body').squeeze()
+
+        tube = self.make_tube('NAME=test_body', name=f'{self.testName}_2', value=6)
+        actual = tube.squeeze().test_body()
+
+        self.assertEqual(6, actual)
+        self.assertEqual(1, self.headers.hits)
+        self.assertNotIn('makeheaders', tube.timings)
+        self.assertNotIn('preprocess_headers', tube.timings)
+
+    def test_cache_hit_restores_cdef(self):
+        first = self.make_tube('NAME=test_cdef')
+        first.squeeze()
+
+        second = self.make_tube('NAME=test_cdef')
+        second.squeeze()
+
+        self.assertEqual(first._cdef, second._cdef)
+
+
+class TestLoad(StoreTestCase):
+
+    def make_tube(self, value: int):
+        return self.create_stored_Tube('load_value') \
+            .add_source_text(f'int load_value(void) {{ return {value}; }}')
+
+    def test_squeeze_leaves_sys_path_alone(self):
+        expected = list(path)
+
+        self.make_tube(1).squeeze()
+
+        self.assertEqual(expected, path)
+
+    def test_squeeze_leaves_sys_modules_alone(self):
+        paste = self.make_tube(5).squeeze()
+
+        actual = [name for name, module in modules.items() if module in (paste._lib, paste._ffi)
+                  or name.startswith('_crelm_') or name.startswith('libload_value')]
+
+        self.assertEqual([], actual)
+
+    def test_repeated_squeeze_reuses_module(self):
+        expected = self.make_tube(2).squeeze()
+        tube = self.make_tube(2)
+
+        actual = tube.squeeze()
+
+        self.assertIs(expected._lib, actual._lib)
+        self.assertEqual({'hits': 1, 'misses': 0}, tube.report.caches['modules'])
+
+    def test_same_name_different_source_loads_each(self):
+        first = self.make_tube(3).squeeze()
+        second = self.make_tube(4).squeeze()
+
+        self.assertEqual(3, first.load_value())
+        self.assertEqual(4, second.load_value())
+
+
+class TestSqueezeAsync(StoreTestCase):
+
+    def make_tube(self):
+        return self.create_stored_Tube(self.testName) \
+            .add_source_text('int test_squeeze_async() { return 11; }')
+
+    def test_squeeze_async(self):
+        actual = run(self.make_tube().squeeze_async())
+
+        self.assertEqual(11, actual.test_squeeze_async())
+
+    def test_squeeze_async_error_returns_None(self):
+        paste = run(self.create_Tube(self.testName)
+                    .add_source_text('this wont compile')
+                    .squeeze_async())
+
+        self.assertIsNone(paste)
+
+    def test_squeeze_async_after_squeeze_of_changed_tube(self):
+        tube = self.make_tube()
+        tube.squeeze()
+
+        tube.add_source_text('int test_squeeze_async_more() { return 12; }')
+        actual = run(tube.squeeze_async())
+
+        self.assertEqual(12, actual.test_squeeze_async_more())
+
+    def test_cancelled_squeeze_async_can_be_retried(self):
+        with self.assertRaises(TimeoutError):
+            run(wait_for(self.make_tube().squeeze_async(), timeout=0.01))
+
+        actual = run(self.make_tube().squeeze_async())
+
+        self.assertEqual(11, actual.test_squeeze_async())
+
+    def test_cancelled_squeeze_async_removes_scratch(self):
+        scratch = path_join(self.store.root, '*.tmp')
+        for folder in glob(scratch):
+            rmtree(folder)
+
+        async def cancel_mid_build():
+            task = ensure_future(self.make_tube().squeeze_async())
+
+            deadline = monotonic() + 60
+            while not glob(scratch) and monotonic() < deadline:
+                await async_sleep(0.01)
+
+            task.cancel()
+            with self.assertRaises(CancelledError):
+                await task
+
+        run(cancel_mid_build())
+
+        self.assertEqual([], glob(scratch))
+
+    def test_squeeze_async_worker_does_not_warn(self):
+        script = '\n'.join([
+            'from asyncio import run',
+            'from sys import argv',
+            'from crelm import Factory, ArtifactStore',
+            'tube = Factory().create_Tube("quiet_worker") \\',
+            '    .set_artifact_store(ArtifactStore(argv[1])) \\',
+            '    .add_source_text("int quiet_worker(void) { return 3; }")',
+            'print(run(tube.squeeze_async()).quiet_worker())'])
+        root = dirname(dirname(realpath(__file__)))
+
+        process = Popen([executable, '-c', script, self.store.root], stdout=PIPE, stderr=PIPE,
+                        env=dict(environ, PYTHONPATH=root))
+        output, errors = process.communicate()
+
+        self.assertEqual(b'3\n', output)
+        self.assertNotIn(b'RuntimeWarning', errors)
+
+
+class TestPasteBinding(TestCase, Factory):
+
+    def test_functions_are_bound_on_first_access(self):
+        sut = self.create_Tube(self.testName) \
+            .add_source_text('int test_lazy() { return 12; }') \
+            .squeeze()
+
+        self.assertNotIn('test_lazy', vars(sut))
+
+        actual = sut.test_lazy()
+
+        self.assertEqual(12, actual)
+        self.assertIn('test_lazy', vars(sut))
+
+    def test_global_variable_is_not_frozen(self):
+        sut = self.create_Tube(self.testName) \
+            .add_header_text('extern int test_counter;\nvoid test_increment();') \
+            .add_source_text('int test_counter = 0;\nvoid test_increment() { ++test_counter; }') \
+            .squeeze()
+
+        before = sut.test_counter
+        sut.test_increment()
+
+        self.assertEqual(before + 1, sut.test_counter)
+
+    def test_missing_attribute_raises(self):
+        sut = self.create_Tube(self.testName) \
+            .add_source_text('int test_missing() { return 1; }') \
+            .squeeze()
+
+        with self.assertRaises(AttributeError):
+            sut.not_a_function
+
+
+@skipIf(not openmp_supported(), 'compiler has no OpenMP')
+class TestOpenMP(TestCase, Factory):
+
+    SOURCE = '''
+#include <omp.h>
+int openmp_threads(void) { return omp_get_max_threads(); }
+double openmp_sum(int n) {
+  double s = 0;
+#pragma omp parallel for reduction(+:s)
+  for (int i = 0; i < n; ++i) s += i;
+  return s;
+}
+'''
+
+    def test_openmp_kernel(self):
+        paste = self.create_Tube('openmp') \
+            .add_header_text('int openmp_threads(void);\ndouble openmp_sum(int n);') \
+            .add_source_text(TestOpenMP.SOURCE) \
+            .enable_openmp() \
+            .squeeze()
+
+        self.assertGreater(paste.openmp_threads(), 0)
+        self.assertEqual(sum(range(10000)), paste.openmp_sum(10000))
+
+    def test_openmp_changes_build_key(self):
+        expected = self.create_Tube('openmp_key').add_source_text('int f(void) { return 1; }')
+        actual = self.create_Tube('openmp_key').add_source_text('int f(void) { return 1; }').enable_openmp()
+
+        self.assertNotEqual(expected._make_build_key(), actual._make_build_key())
+
+    def test_enable_openmp_twice_adds_flags_once(self):
+        actual = self.create_Tube('openmp_twice').enable_openmp().enable_openmp()
+
+        self.assertEqual(['-fopenmp'], actual._link_args)
+
+
+class TestOptimize(StoreTestCase):
+
+    def make_tube(self, name: str):
+        return self.create_stored_Tube(name) \
+            .add_source_text(f'double {name}(double x) {{ return x * 2; }}') \
+            .add_macro('UNUSED=1')
+
+    def test_repeated_builds_do_not_grow_args(self):
+        tube = self.make_tube('optimize_repeat')
+        tube.build()
+        expected = tube._make_build_key()
+
+        tube.build()
+
+        self.assertEqual(expected, tube._make_build_key())
+        self.assertEqual(1, tube._build_compiler_args().count('-DUNUSED=1'))
+
+    def test_profile_args(self):
+        tube = self.make_tube('optimize_args').optimize('O3', native=True, lto=True, fast_math=True)
+
+        self.assertEqual(['-O3', '-march=native', '-ffast-math', '-flto=auto'], tube._profile_args())
+        self.assertIn('-flto=auto', tube._build_link_args())
+
+    def test_no_lto_keeps_link_args(self):
+        tube = self.make_tube('optimize_no_lto').optimize('O3')
+
+        self.assertEqual([], tube._build_link_args())
+
+    def test_profile_changes_build_key(self):
+        expected = self.make_tube('optimize_key')._make_build_key()
+
+        actual = self.make_tube('optimize_key').optimize('O3')._make_build_key()
+
+        self.assertNotEqual(expected, actual)
+
+    def test_unknown_level_raises(self):
+        with self.assertRaises(ValueError):
+            self.make_tube('optimize_bad').optimize('O9')
+
+    def test_optimized_build_runs_and_is_reported(self):
+        tube = self.make_tube('optimize_run').optimize('O3', native=True, lto=True)
+
+        actual = tube.squeeze().optimize_run(2.5)
+
+        self.assertEqual(5, actual)
+        self.assertEqual('O3', tube.report.profile['level'])
+        self.assertTrue(tube.report.profile['arch'])
+
+
+class TestPgo(StoreTestCase):
+
+    SOURCE = '''
+int pgo_classify(int x) { if (x % 7 == 0) return 3; if (x % 3 == 0) return 1; return 2; }
+long pgo_total(int n) { long s = 0; for (int i = 0; i < n; ++i) s += pgo_classify(i); return s; }
+'''
+
+    def setUp(self):
+        super().setUp()
+        self.trained = 0
+
+    def make_tube(self):
+        return self.create_stored_Tube('pgo_total') \
+            .add_source_text(TestPgo.SOURCE)
+
+    def train(self, paste):
+        self.trained += 1
+        paste.pgo_total(100000)
+
+    def test_squeeze_pgo(self):
+        tube = self.make_tube()
+
+        paste = tube.squeeze_pgo(self.train, compare=True, retrain=True)
+
+        self.assertEqual(self.make_tube().squeeze().pgo_total(1000), paste.pgo_total(1000))
+        self.assertEqual(2, self.trained)
+        self.assertTrue(tube.report.pgo['trained'])
+        self.assertGreater(tube.report.pgo['instrumented_build'], 0)
+        self.assertGreater(tube.report.pgo['instrumented_training'], 0)
+        self.assertGreater(tube.report.pgo['optimized_training'], 0)
+        self.assertIn('-fprofile-use', sum(tube.report.commands, []))
+
+    def test_squeeze_pgo_is_cached(self):
+        self.make_tube().squeeze_pgo(self.train)
+        tube = self.make_tube()
+
+        paste = tube.squeeze_pgo(self.train)
+
+        self.assertIsNotNone(paste)
+        self.assertEqual(1, self.trained)
+        self.assertFalse(tube.report.pgo['trained'])
+        self.assertTrue(tube.report.cache_hit)
+
+    def test_squeeze_pgo_retrain_loads_new_module(self):
+        expected = self.make_tube().squeeze_pgo(self.train)
+        tube = self.make_tube()
+
+        actual = tube.squeeze_pgo(lambda paste: paste.pgo_total(5000), retrain=True)
+
+        self.assertIsNot(expected._lib, actual._lib)
+        self.assertEqual({'hits': 0, 'misses': 1}, tube.report.caches['modules'])
+        self.assertEqual(expected.pgo_total(1000), actual.pgo_total(1000))
+
+    def test_squeeze_pgo_profile_is_pruned_with_the_store(self):
+        tube = self.make_tube()
+        tube.squeeze_pgo(self.train)
+
+        self.assertTrue(tube._pgo_folder.startswith(self.store.root))
+        self.assertTrue(glob(path_join(tube._pgo_folder, '*.gcda')))
+        self.assertIn('pgo_total_pgo', self.store.stats()['names'])
+
+        self.store.clear()
+
+        self.assertFalse(exists(tube._pgo_folder))
+
+    def test_pgo_changes_build_key(self):
+        tube = self.make_tube()
+        expected = tube._make_build_key()
+
+        tube._pgo_mode = 'use'
+
+        self.assertNotEqual(expected, tube._make_build_key())
+
+
+class TestWatch(StoreTestCase):
+
+    def write_source(self, value: int) -> str:
+        return self.writeFile('watched.c', f'int watched(void) {{ return {value}; }}')
+
+    def make_tube(self):
+        return self.create_stored_Tube('watched') \
+            .add_header_text('int watched(void);') \
+            .add_source_file(self.write_source(1))
+
+    def change_source(self, value: int):
+        filename = self.write_source(value)
+        utime(filename, ns=(time_ns(), time_ns()))
+
+    def test_poll_swaps_paste_after_change(self):
+        tube = self.make_tube()
+        paste = tube.watch(interval=3600)
+        self.addCleanup(tube.unwatch)
+        before = paste.current
+
+        self.change_source(2)
+        first = tube._watcher.poll()
+        second = tube._watcher.poll()
+
+        self.assertEqual((False, True), (first, second))
+        self.assertEqual(2, paste.watched())
+        self.assertEqual(1, paste.generation)
+        self.assertEqual(1, before.watched())
+
+    def test_poll_leaves_process_and_tube_alone(self):
+        tube = self.make_tube()
+        tube.watch(interval=3600)
+        self.addCleanup(tube.unwatch)
+        expected = (tube._gen_foldername, tube._lib, tube.report)
+
+        self.change_source(2)
+        with patch('os.chdir') as chdir:
+            tube._watcher.poll()
+            tube._watcher.poll()
+
+        chdir.assert_not_called()
+        self.assertEqual(1, tube._watcher.generation)
+        self.assertEqual(expected, (tube._gen_foldername, tube._lib, tube.report))
+
+    def test_poll_rebuilds_after_included_header_change(self):
+        self.writeFile('watched_inner.h', '#define WATCHED_VALUE 4')
+        tube = self.create_stored_Tube('watched_nested') \
+            .add_header_text('int watched_nested(void);') \
+            .add_source_file(self.writeFile(
+                'watched_nested.c', '#include "watched_inner.h"\nint watched_nested(void) { return WATCHED_VALUE; }'))
+        paste = tube.watch(interval=3600)
+        self.addCleanup(tube.unwatch)
+
+        filename = self.writeFile('watched_inner.h', '#define WATCHED_VALUE 5')
+        utime(filename, ns=(time_ns(), time_ns()))
+        tube._watcher.poll()
+        tube._watcher.poll()
+
+        self.assertEqual(5, paste.watched_nested())
+        self.assertEqual(1, paste.generation)
+        self.assertFalse(tube._watcher.poll())
+
+    def test_poll_without_change_keeps_paste(self):
+        tube = self.make_tube()
+        paste = tube.watch(interval=3600)
+        self.addCleanup(tube.unwatch)
+
+        actual = [tube._watcher.poll(), tube._watcher.poll()]
+
+        self.assertEqual([False, False], actual)
+        self.assertEqual(0, paste.generation)
+
+    def test_failed_rebuild_keeps_old_paste(self):
+        tube = self.make_tube()
+        paste = tube.watch(interval=3600)
+        self.addCleanup(tube.unwatch)
+
+        self.writeFile('watched.c', 'int watched(void) { return }')
+        tube._watcher.poll()
+        tube._watcher.poll()
+
+        self.assertEqual(1, paste.watched())
+        self.assertIsNotNone(paste.error)
+
+    def test_background_thread_rebuilds(self):
+        tube = self.make_tube()
+
+        with tube.watch(interval=0.05) as paste:
+            self.change_source(3)
+
+            deadline = monotonic() + 60
+            while 0 == paste.generation and monotonic() < deadline:
+                sleep(0.05)
+
+            self.assertEqual(3, paste.watched())
+
+        self.assertFalse(tube._watcher._thread.is_alive())
@@ -0,0 +1,135 @@
+from array import array
+from os.path import join as path_join, dirname, realpath
+from unittest import skipIf
+
+from cffi import FFI
+
+from crelm import Factory
+from crelm.vectorize import vectorized_wrapper
+
+from john import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EXAMPLES_FOLDER = path_join(dirname(realpath(__file__)), '..', 'examples')
+
+
+def make_ffi(cdef: str) -> FFI:
+    ffi = FFI()
+    ffi.cdef(cdef)
+    return ffi
+
+
+class VectorizedWrapperTests(TestCase):
+
+    def test_numeric_arguments_take_pointer_and_step(self):
+        declaration, _ = vectorized_wrapper(
+            make_ffi('double f(double x, int k);'), 'f')
+
+        self.assertEqual('void crelm_vec_f(double const *a0, size_t a0_step, '
+                         'int const *a1, size_t a1_step, double *out, size_t n);', declaration)
+
+    def test_pointer_arguments_pass_through(self):
+        _, source = vectorized_wrapper(
+            make_ffi('struct s { int a; }; int f(struct s *p, int i);'), 'f')
+
+        self.assertIn('out[i] = f(a0, a1[i * a1_step]);', source)
+
+    def test_void_function_has_no_out(self):
+        declaration, _ = vectorized_wrapper(make_ffi('void f(int x);'), 'f')
+
+        self.assertNotIn('out', declaration)
+
+    def test_undeclared_function_raises(self):
+        with self.assertRaises(ValueError):
+            vectorized_wrapper(make_ffi('void f(int x);'), 'g')
+
+    def test_struct_by_value_raises(self):
+        with self.assertRaises(ValueError):
+            vectorized_wrapper(
+                make_ffi('struct s { int a; }; int f(struct s p);'), 'f')
+
+
+class VectorizedPasteTests(TestCase, Factory):
+
+    def make_paste(self):
+        return self.create_Tube('vectorized') \
+            .add_source_text('double vectorized_scale(double x, int k) { return x * k; }\n'
+                             'void vectorized_sum(int x, int *total) { *total += x; }\n'
+                             'int vectorized_plain(int x) { return x; }') \
+            .add_vectorized('vectorized_scale') \
+            .add_vectorized('vectorized_sum') \
+            .squeeze()
+
+    def test_scalar_call_still_works(self):
+        actual = self.make_paste().vectorized_scale(2.0, 3)
+
+        self.assertEqual(6.0, actual)
+
+    def test_vec_over_arrays(self):
+        actual = self.make_paste().vectorized_scale.vec(
+            array('d', [1, 2, 3]), array('i', [2, 3, 4]))
+
+        self.assertEqual(array('d', [2, 6, 12]), actual)
+
+    def test_vec_broadcasts_scalars(self):
+        actual = self.make_paste().vectorized_scale.vec(array('d', [1, 2]), 10)
+
+        self.assertEqual(array('d', [10, 20]), actual)
+
+    def test_vec_writes_into_out(self):
+        out = array('d', [0, 0, 0])
+
+        actual = self.make_paste().vectorized_scale.vec(array('d', [1, 2, 3]), 2, out=out)
+
+        self.assertIs(out, actual)
+        self.assertEqual(array('d', [2, 4, 6]), out)
+
+    def test_vec_passes_pointers_through(self):
+        paste = self.make_paste()
+        total = paste.new('int')
+
+        paste.vectorized_sum.vec(array('i', range(10)), total)
+
+        self.assertEqual(45, total[0])
+
+    def test_vec_rejects_wrong_type(self):
+        with self.assertRaises(TypeError):
+            self.make_paste().vectorized_scale.vec(array('i', [1, 2]), 2)
+
+    def test_vec_rejects_different_lengths(self):
+        with self.assertRaises(ValueError):
+            self.make_paste().vectorized_scale.vec(array('d', [1, 2]), array('i', [1]))
+
+    def test_unvectorized_function_has_no_vec(self):
+        self.assertFalse(hasattr(self.make_paste().vectorized_plain, 'vec'))
+
+    @skipIf(numpy is None, 'numpy not installed')
+    def test_vec_returns_numpy_for_numpy_input(self):
+        actual = self.make_paste().vectorized_scale.vec(numpy.arange(4.0), 2)
+
+        self.assertIsInstance(actual, numpy.ndarray)
+        self.assertEqual([0, 2, 4, 6], actual.tolist())
+
+    def test_vec_matches_scalar_calls_for_pi_series(self):
+        paste = self.create_Tube('vectorized_pi') \
+            .set_source_folder(EXAMPLES_FOLDER) \
+            .add_header_file('pi.h') \
+            .add_source_file('pi.c') \
+            .add_macros(['USE_NILAKANTHA', 'USE_DOUBLE']) \
+            .add_vectorized('infinite_series_run') \
+            .squeeze()
+
+        points = [1, 10, 100, 1000]
+
+        state = paste.new('struct infinite_series_state_t')
+        paste.infinite_series_init(state)
+        expected = [paste.infinite_series_run(state, x) for x in points]
+
+        paste.infinite_series_init(state)
+        actual = paste.infinite_series_run.vec(state, array('L', points))
+
+        self.assertEqual(expected, list(actual))